@@ -0,0 +1,315 @@
+import numpy as np
+import polars as pl
+from risk_metrics import max_drawdown, risk_summary, summary_metrics
+
+# Level based backtest of the opening range breakout (levels: 0 = range low, 1 = range high).
+# The conditions are the ones of the Strategy Backtester tab. A sweep evaluates all (buy in, stop loss,
+# take profit) combinations of a level grid at once, indexed [buy_in, stop_loss, take_profit].
+# bar_outcomes replays the trades candle by candle on the 5min session bars of the ORB calculations.
+
+# Outcome of a day
+no_trade, stop_loss, take_profit, partial_win, partial_loss = range(5)
+
+
+def sweep_levels(low=-1.0, high=3.0, step=0.1):
+    # rounded, so the grid levels equal the levels entered in the dashboard
+    return np.round(low + np.arange(int(round((high - low) / step)) + 1) * step, 2)
+
+
+def level_indicators(df, levels, side):
+    # day x level matrices of the trade conditions, NaN levels never fulfill a condition
+    retracement = np.asarray(df["retracement_level"], dtype=float)[:, None]
+    expansion = np.asarray(df["expansion_level"], dtype=float)[:, None]
+    after_conf_min = np.asarray(df["after_conf_min_level"], dtype=float)[:, None]
+    after_conf_max = np.asarray(df["after_conf_max_level"], dtype=float)[:, None]
+    close = np.asarray(df["session_close_level"], dtype=float)[:, None]
+
+    if side == "long":
+        # entry on the retracement before the high of the session or after it
+        entered = (retracement <= levels) | ((retracement > levels) & (after_conf_min <= levels))
+        stopped = (retracement <= levels) | ((retracement > levels) & (after_conf_min <= levels))
+        # target hits need the stop to survive the retracement
+        target_open = (retracement > levels) & ~stopped
+        target_hit = expansion >= levels
+        close_win = close >= levels
+        close_loss = close < levels
+    else:
+        entered = (retracement >= levels) | ((retracement < levels) & (after_conf_max > levels))
+        stopped = (retracement >= levels) | ((retracement < levels) & (after_conf_max >= levels))
+        target_open = (retracement < levels) & ~stopped
+        target_hit = expansion <= levels
+        close_win = close <= levels
+        close_loss = close > levels
+
+    return {"entered": entered, "stopped": stopped, "target_open": target_open, "target_hit": target_hit,
+            "close_win": close_win, "close_loss": close_loss, "close_distance": np.abs(close - levels)}
+
+
+def sweep_risk(df, side, buy_in, levels=None):
+    # risk metrics of the trade sequences of every (stop loss, take profit) combination of one buy in level
+    levels = sweep_levels() if levels is None else np.asarray(levels, dtype=float)
+    ind = level_indicators(df, np.r_[buy_in, levels], side)
+    entered = ind["entered"][:, 0]
+    close_distance = np.where(ind["close_win"][:, 0], 1, -1) * ind["close_distance"][:, 0]
+    target_distance = np.abs(buy_in - levels)
+    shape = (len(levels), len(levels))
+    result = {name: np.full(shape, np.nan) for name in summary_metrics}
+    for stop in range(len(levels)):
+        stop_loss = levels[stop]
+        if (side == "long" and stop_loss >= buy_in) or (side == "short" and stop_loss <= buy_in):
+            continue
+        risk = abs(buy_in - stop_loss)
+        stopped = ind["stopped"][entered, stop + 1]
+        open_days = ind["target_open"][entered, stop + 1]
+        # take profit x entered day, NaN: no session close, no trade like in level_outcomes
+        r = np.where(open_days & ind["target_hit"][entered, 1:].T, (target_distance / risk)[:, None],
+                     close_distance[entered] / risk)
+        r[:, stopped] = -1
+        traded = ~np.isnan(r)
+        for name, values in risk_summary(np.where(traded, r, 0)).items():
+            result[name][stop] = values
+        # take profits with untraded days are evaluated on their trades only
+        for target in np.flatnonzero(~traded.all(axis=1)):
+            for name, value in risk_summary(r[target, traded[target]]).items():
+                result[name][stop, target] = value
+    take_profit = np.broadcast_to(levels, shape)
+    invalid = take_profit <= buy_in if side == "long" else take_profit >= buy_in
+    for values in result.values():
+        values[invalid] = np.nan
+    return result
+
+
+def trade_outcomes(stopped, took_profit, close_win, close_loss, r):
+    outcome = np.select([stopped, took_profit, close_win, close_loss],
+                        [stop_loss, take_profit, partial_win, partial_loss], no_trade).astype(np.int8)
+    return outcome, np.where(outcome == no_trade, np.nan, r)
+
+
+def level_outcomes(df, side, buy_in, sl, tp):
+    # outcome and realized R of every day with the level rules of the Strategy Backtester
+    ind = level_indicators(df, np.array([buy_in, sl, tp], dtype=float), side)
+    entered = ind["entered"][:, 0]
+    stopped = entered & ind["stopped"][:, 1]
+    took_profit = entered & ind["target_open"][:, 1] & ind["target_hit"][:, 2]
+    risk = abs(buy_in - sl)
+    close_r = np.where(ind["close_win"][:, 0], 1, -1) * ind["close_distance"][:, 0] / risk
+    r = np.where(stopped, -1, np.where(took_profit, abs(buy_in - tp) / risk, close_r))
+    return trade_outcomes(stopped, took_profit, entered & ind["close_win"][:, 0], entered & ind["close_loss"][:, 0],
+                          r)
+
+
+def trade_kpis(outcome, r, buy_in, sl, tp):
+    # KPIs of the Strategy Backtester, partial trades count their level distance for the profit factor
+    counts = np.bincount(outcome, minlength=5)
+    trades = len(outcome) - counts[no_trade]
+    risk = abs(buy_in - sl)
+    target_r = abs(buy_in - tp) / risk
+    win_r = counts[take_profit] * target_r + r[outcome == partial_win].sum() * risk
+    loss_r = counts[stop_loss] - r[outcome == partial_loss].sum() * risk
+    realized_r = np.nansum(r)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {
+            "trades": trades,
+            "tp_count": counts[take_profit],
+            "sl_count": counts[stop_loss],
+            "part_win_count": counts[partial_win],
+            "part_loss_count": counts[partial_loss],
+            "win_rate": np.float64(counts[take_profit] + counts[partial_win]) / trades,
+            "target_r": target_r,
+            "profit_factor": np.float64(win_r) / loss_r,
+            "avg_r": np.float64(realized_r) / trades,
+            "realized_r": realized_r,
+        }
+
+
+def equity_curve(outcome, r):
+    # cumulative R and row positions of the traded days
+    traded = np.flatnonzero(outcome != no_trade)
+    return np.cumsum(r[traded]), traded
+
+
+def block_ids(dates, block="week"):
+    # week (starting on monday) or month number of each date
+    days = np.asarray(dates, dtype="datetime64[D]")
+    if block == "week":
+        return (days.astype(np.int64) + 3) // 7  # 1970-01-01 is a thursday
+    return days.astype("datetime64[M]").astype(np.int64)
+
+
+def padded_blocks(blocks):
+    # positions of the trades of each block (consecutive ids), rows padded with -1
+    starts = np.flatnonzero(np.r_[True, blocks[1:] != blocks[:-1]])
+    counts = np.diff(np.r_[starts, len(blocks)])
+    column = np.arange(counts.max())
+    return np.where(column < counts[:, None], starts[:, None] + column, -1)
+
+
+def block_bootstrap(dates, outcome, r, buy_in, sl, tp, block="week", samples=2000, seed=0, batch=250,
+                    progress=None):
+    # Resamples whole weeks/months of trades with replacement, every sample draws as many blocks as the
+    # history has. Samples are evaluated in batches, progress(done, samples) is called after each batch.
+    traded = (outcome != no_trade) & ~np.isnan(r)
+    order = np.argsort(np.asarray(dates)[traded], kind="stable")
+    dates, outcome, r = np.asarray(dates)[traded][order], outcome[traded][order], r[traded][order]
+    result = {name: np.full(samples, np.nan) for name in ["win_rate", "profit_factor", "max_drawdown", "final_r"]}
+    if len(outcome) == 0:
+        return result
+
+    risk = abs(buy_in - sl)
+    win_amount = np.select([outcome == take_profit, outcome == partial_win], [abs(buy_in - tp) / risk, r * risk])
+    loss_amount = np.select([outcome == stop_loss, outcome == partial_loss], [1, -r * risk])
+    win = np.isin(outcome, [take_profit, partial_win])
+    # the padding (-1) picks the appended empty trade
+    trade_values = [np.append(values, 0) for values in [np.ones(len(r)), win, win_amount, loss_amount, r]]
+    blocks = padded_blocks(block_ids(dates, block))
+
+    rng = np.random.default_rng(seed)
+    for first in range(0, samples, batch):
+        size = min(batch, samples - first)
+        picks = blocks[rng.integers(0, len(blocks), (size, len(blocks)))].reshape(size, -1)
+        trades, wins, win_r, loss_r, sample_r = [values[picks] for values in trade_values]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result["win_rate"][first:first + size] = wins.sum(axis=1) / trades.sum(axis=1)
+            result["profit_factor"][first:first + size] = win_r.sum(axis=1) / loss_r.sum(axis=1)
+        result["max_drawdown"][first:first + size] = max_drawdown(sample_r)
+        result["final_r"][first:first + size] = sample_r.sum(axis=1)
+        if progress is not None:
+            progress(first + size, samples)
+    return result
+
+
+def bootstrap_intervals(result, confidence=0.9):
+    # lower bound, median and upper bound of every bootstrapped KPI
+    tail = (1 - confidence) / 2 * 100
+    return {name: np.nanpercentile(values, [tail, 50, 100 - tail]) for name, values in result.items()}
+
+
+def bar_outcomes(bars, orb_table, side, buy_in, sl, tp):
+    # Candle by candle backtest on the 5min session bars ("5_min_session" of OpeningRange) of the breakout days
+    # in orb_table. Levels are converted to prices with the opening range of the day. A trade is entered on the
+    # first bar after the breakout bar that touches the entry and exits on the first bar that touches the stop
+    # or the target, otherwise at the session close. The order inside a bar is unknown, so the stop wins if
+    # both are touched in the same bar and the target does not count on the entry bar.
+    days = orb_table.filter(pl.col("breakout_time").is_not_null() & (pl.col("upday") == (side == "long")))
+    days = days.sort("date")
+    day_dates = days["date"].to_physical().to_numpy()
+    outcome = np.full(len(days), no_trade, dtype=np.int8)
+    r = np.full(len(days), np.nan)
+
+    bars = bars.sort(["date", "time"])
+    bar_dates = bars["date"].to_physical().to_numpy()
+    day = np.searchsorted(day_dates, bar_dates)
+    on_day = day < len(day_dates)
+    on_day[on_day] = day_dates[day[on_day]] == bar_dates[on_day]
+    bars, day = bars.filter(pl.Series(on_day)), day[on_day]
+    if len(day) == 0:
+        return days["date"], outcome, r
+
+    starts = np.flatnonzero(np.r_[True, day[1:] != day[:-1]])
+    counts = np.diff(np.r_[starts, len(day)])
+    position = np.arange(len(day))
+
+    def first(mask):
+        # position of the first bar of each day in mask, len(position) if there is none
+        return np.minimum.reduceat(np.where(mask, position, len(position)), starts)
+
+    range_low = days["range_low"].to_numpy()[day]
+    range_width = days["range_high"].to_numpy()[day] - range_low
+    entry_price, stop_price, target_price = [range_low + level * range_width for level in [buy_in, sl, tp]]
+    high, low, close = [bars[col].to_numpy() for col in ["high", "low", "close"]]
+    in_session = bars["session"].to_numpy()
+    breakout_time = days["breakout_time"].dt.epoch("us").to_numpy()[day]
+    tradeable = in_session & (bars["time"].dt.epoch("us").to_numpy() > breakout_time)
+
+    if side == "long":
+        entry_touch, stop_touch, target_touch = low <= entry_price, low <= stop_price, high >= target_price
+    else:
+        entry_touch, stop_touch, target_touch = high >= entry_price, high >= stop_price, low <= target_price
+
+    entry = first(tradeable & entry_touch)
+    entry_bar = np.repeat(entry, counts)
+    stop = first(tradeable & stop_touch & (position >= entry_bar))
+    target = first(tradeable & target_touch & (position > entry_bar))
+    session_close = close[np.maximum.reduceat(np.where(in_session, position, -1), starts)]
+
+    entered = entry < len(position)
+    stopped = entered & (stop < len(position)) & (stop <= target)
+    took_profit = entered & ~stopped & (target < len(position))
+    entry_level, stop_level = entry_price[starts], stop_price[starts]
+    close_r = (session_close - entry_level) / (entry_level - stop_level)
+    day_r = np.where(stopped, -1, np.where(took_profit, abs(buy_in - tp) / abs(buy_in - sl), close_r))
+    if side == "long":
+        close_win, close_loss = session_close >= entry_level, session_close < entry_level
+    else:
+        close_win, close_loss = session_close <= entry_level, session_close > entry_level
+    outcome[day[starts]], r[day[starts]] = trade_outcomes(stopped, took_profit, entered & close_win,
+                                                          entered & close_loss, day_r)
+    return days["date"], outcome, r
+
+
+def level_sweep(df, side, levels=None):
+    levels = sweep_levels() if levels is None else np.asarray(levels, dtype=float)
+    n = len(levels)
+    ind = level_indicators(df, levels, side)
+
+    entered = ind["entered"].astype(float)
+    not_stopped = (~ind["stopped"]).astype(float)
+    target_open = ind["target_open"].astype(float)
+    target_hit = ind["target_hit"].astype(float)
+    win = entered * ind["close_win"]
+    loss = entered * ind["close_loss"]
+    win_distance = np.where(ind["close_win"], ind["close_distance"], 0) * entered
+    loss_distance = np.where(ind["close_loss"], ind["close_distance"], 0) * entered
+
+    trades = entered.sum(axis=0)
+    stop_hits = entered.T @ ind["stopped"].astype(float)
+
+    # Sums over the days that are not stopped [buy_in, stop_loss] and over the take profit days
+    # [buy_in, stop_loss, take_profit]. Days with a take profit are never stopped, so the partial trades
+    # are the not stopped days minus the take profit days.
+    weights = np.stack([entered, win, loss, win_distance, loss_distance])  # quantity x day x buy in
+    not_stopped_sums = weights.transpose(0, 2, 1) @ not_stopped  # quantity x buy in x stop loss
+    tp_sums = np.empty((len(weights), n, n, n))
+    for buy_in in range(n):
+        # days weighted by the quantity at this buy in level and open for the target at each stop loss
+        open_days = (weights[:, :, buy_in, None] * target_open).transpose(0, 2, 1)  # quantity x stop loss x day
+        tp_sums[:, buy_in] = open_days @ target_hit
+
+    tp_count = tp_sums[0]
+    part_win = not_stopped_sums[1][:, :, None] - tp_sums[1]
+    part_loss = not_stopped_sums[2][:, :, None] - tp_sums[2]
+    part_win_sum = not_stopped_sums[3][:, :, None] - tp_sums[3]
+    part_loss_sum = not_stopped_sums[4][:, :, None] - tp_sums[4]
+
+    buy_in, stop_loss, take_profit = np.meshgrid(levels, levels, levels, indexing="ij")
+    if side == "long":
+        valid = (stop_loss < buy_in) & (buy_in < take_profit)
+    else:
+        valid = (take_profit < buy_in) & (buy_in < stop_loss)
+    valid &= trades[:, None, None] > 0
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        risk = np.abs(buy_in - stop_loss)
+        target_r = np.abs(buy_in - take_profit) / risk
+        sl_count = np.broadcast_to(stop_hits[:, :, None], valid.shape)
+        win_rate = (part_win + tp_count) / trades[:, None, None]
+        profit_factor = (tp_count * target_r + part_win_sum) / (sl_count + part_loss_sum)
+        realized_r = tp_count * target_r - sl_count + (part_win_sum - part_loss_sum) / risk
+        avg_r = realized_r / trades[:, None, None]
+
+    def masked(values):
+        return np.where(valid, values, np.nan)
+
+    return {
+        "levels": levels,
+        "trades": np.broadcast_to(trades[:, None, None], valid.shape),
+        "sl_count": sl_count,
+        "tp_count": tp_count,
+        "part_win_count": part_win,
+        "part_loss_count": part_loss,
+        "target_r": masked(target_r),
+        "win_rate": masked(win_rate),
+        "profit_factor": masked(profit_factor),
+        "realized_r": masked(realized_r),
+        "avg_r": masked(avg_r),
+    }
@@ -0,0 +1,121 @@
+import os
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pyarrow.feather as feather
+
+# ORB tables of several symbols (same session and opening range duration) aligned on the union of their days.
+# Every field is a (day x symbol) float array, NaN where a symbol has no ORB table row for the day.
+# Pairwise statistics of all symbols are matrix products of these arrays.
+
+panel_columns = ["greenbox", "upday", "breakout_time", "max_retracement_time", "max_expansion_time",
+                 "retracement_level", "expansion_level", "opening_level", "closing_level", "session_close_level"]
+time_fields = ["breakout_time", "max_retracement_time", "max_expansion_time"]
+level_fields = ["retracement_level", "expansion_level", "opening_level", "closing_level", "session_close_level"]
+
+# breakout side codes of the "side" field
+long_side, short_side, no_side = 1, -1, 0
+
+
+def read_orb_columns(file_name, columns=None):
+    # columns of a parquet/feather/csv ORB table indexed by date, times as seconds since midnight (NY time)
+    columns = panel_columns if columns is None else columns
+    wanted = columns + [f"{col}_tod" for col in time_fields if col in columns]
+    if os.path.isfile(f"{file_name}.parquet"):
+        file_columns = [col for col in pq.read_schema(f"{file_name}.parquet").names if col in wanted + ["date"]]
+        df = pq.read_table(f"{file_name}.parquet", columns=file_columns).to_pandas(date_as_object=False)
+        df = df.set_index("date")
+    elif os.path.isfile(f"{file_name}.feather"):
+        file_columns = [col for col in feather.read_table(f"{file_name}.feather", memory_map=True).column_names
+                        if col in wanted + ["date"]]
+        df = feather.read_table(f"{file_name}.feather", columns=file_columns).to_pandas(date_as_object=False)
+        df = df.set_index("date")
+    else:
+        df = pd.read_csv(f"{file_name}.csv", sep=";", index_col=0, parse_dates=True,
+                         usecols=lambda col: col in wanted + ["date"])
+
+    for col in [col for col in time_fields if col in columns]:
+        if f"{col}_tod" in df.columns:
+            df[col] = df.pop(f"{col}_tod").astype(float)
+        else:
+            if not isinstance(df[col].dtype, pd.DatetimeTZDtype):
+                df[col] = pd.to_datetime(df[col], unit="us", utc=True)
+            ny_time = df[col].dt.tz_convert("America/New_York")
+            df[col] = ny_time.dt.hour * 3600 + ny_time.dt.minute * 60 + ny_time.dt.second
+    return df
+
+
+def load_panel(symbols, session, orb_duration, folder="data"):
+    tables = {}
+    for symbol in symbols:
+        file_name = os.path.join(folder, f"{symbol}_{session}_{orb_duration}")
+        if any(os.path.isfile(f"{file_name}.{file_format}") for file_format in ["parquet", "feather", "csv"]):
+            tables[symbol] = read_orb_columns(file_name)
+    return SymbolPanel(tables)
+
+
+class SymbolPanel:
+    def __init__(self, tables):
+        self.symbols = list(tables)
+        self.dates = pd.DatetimeIndex(sorted(set().union(*[table.index for table in tables.values()])))
+        self.present = np.zeros((len(self.dates), len(self.symbols)), dtype=bool)
+        self.fields = {name: np.full(self.present.shape, np.nan) for name in ["side"] + panel_columns}
+        for column, table in enumerate(tables.values()):
+            rows = self.dates.get_indexer(table.index)
+            self.present[rows, column] = True
+            for name in panel_columns:
+                self.fields[name][rows, column] = table[name].astype(float).to_numpy()
+            self.fields["side"][rows, column] = np.select(
+                [table["upday"].eq(True), table["breakout_time"].notna()], [long_side, short_side], no_side)
+
+    def day_mask(self, dates=None):
+        # (day x 1) mask of the panel days in dates (all days if None)
+        if dates is None:
+            return np.ones((len(self.dates), 1))
+        return self.dates.isin(dates)[:, None].astype(float)
+
+    def common_days(self, dates=None):
+        # [i, j] number of days with a row of both symbols
+        present = self.present * self.day_mask(dates)
+        return present.T @ present
+
+    def agreement(self, field, dates=None):
+        # [i, j] share of the common days of symbol i and j with the same value of field
+        values = self.fields[field]
+        agree = np.zeros((len(self.symbols), len(self.symbols)))
+        for value in np.unique(values[~np.isnan(values)]):
+            is_value = (values == value) * self.day_mask(dates)
+            agree += is_value.T @ is_value
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return agree / self.common_days(dates)
+
+    def conditional(self, field, value, dates=None):
+        # [i, j] share of the days with field == value for symbol i where symbol j has the same value
+        is_value = (self.fields[field] == value) * self.day_mask(dates)
+        given = is_value.T @ self.present
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return (is_value.T @ is_value) / given
+
+    def correlation(self, field, dates=None):
+        # [i, j] Pearson correlation of field over the days where both symbols have a value
+        values = self.fields[field]
+        valid = ~np.isnan(values) * self.day_mask(dates)
+        x = np.where(valid > 0, values, 0)
+        n = valid.T @ valid
+        sum_x = x.T @ valid  # [i, j] sum of the values of i on the common days
+        sum_xx = (x ** 2).T @ valid
+        sum_xy = x.T @ x
+        with np.errstate(divide="ignore", invalid="ignore"):
+            covariance = n * sum_xy - sum_x * sum_x.T
+            variance = n * sum_xx - sum_x ** 2
+            return covariance / np.sqrt(variance * variance.T)
+
+    def join_table(self, first_symbol, second_symbol, columns=None):
+        # ORB table columns of both symbols on the days of the first symbol
+        columns = panel_columns if columns is None else columns
+        first, second = self.symbols.index(first_symbol), self.symbols.index(second_symbol)
+        rows = self.present[:, first]
+        return pd.DataFrame(
+            {f"{col}_{symbol}": self.fields[col][rows, column]
+             for symbol, column in [(first_symbol, first), (second_symbol, second)] for col in columns},
+            index=self.dates[rows])
@@ -0,0 +1,48 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+# Bitmap index over the days of an ORB table. Every value of a filter field has a packed bitmap (one bit per day).
+# Filters are combined with bitwise and/or and the table is sliced once with the resulting row positions.
+
+
+class FilterIndex:
+    def __init__(self, df):
+        self.size = len(df)
+        self.all_rows = np.packbits(np.ones(self.size, dtype=bool))
+
+        fields = {
+            "weekday": df.index.weekday,
+            "month": df.index.month,
+            "year": df.index.year,
+            # short days need a breakout, long days are all up days
+            "side": np.select([df["upday"].eq(True), df["breakout_time"].notna()], ["Long", "Short"], "None"),
+            "greenbox": df["greenbox"].eq(True),
+            "model": df["model"],  # model codes, 0 is the "None" model
+            "breakout_window": df["breakout_window"],
+        }
+
+        self.bitmaps = {}
+        for field, values in fields.items():
+            codes, uniques = pd.factorize(values, sort=True)
+            self.bitmaps[field] = {value: np.packbits(codes == code) for code, value in enumerate(uniques.tolist())}
+
+    def select(self, field, values):
+        # rows with any of the values
+        rows = np.zeros_like(self.all_rows)
+        for value in values:
+            if value in self.bitmaps[field]:
+                rows |= self.bitmaps[field][value]
+        return rows
+
+    def values(self, field, rows=None):
+        # sorted values of the field that occur in the selected rows
+        return [value for value, bitmap in self.bitmaps[field].items() if rows is None or (bitmap & rows).any()]
+
+    def positions(self, rows):
+        return np.flatnonzero(np.unpackbits(rows, count=self.size))
+
+    def signature(self, rows):
+        # identifies a filter combination, e.g. as part of a cache key
+        return hashlib.blake2b(rows.tobytes(), digest_size=16).hexdigest()
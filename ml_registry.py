@@ -0,0 +1,297 @@
+import argparse
+import glob
+import os
+import pickle
+import threading
+import time as t
+from collections import OrderedDict
+
+import numpy as np
+
+# Models of the ML tab: ml_models/{symbol}_{dr|odr}_simple_confirmation_bias_{model|scaler}.pickle
+# dr models belong to the ny session and odr models to the ldn session, the asia session has no models.
+ml_sessions = {"ny": "dr", "ldn": "odr"}
+model_file = "{symbol}_{ml_session}_simple_confirmation_bias_{kind}.pickle"
+
+# Compact models: the trees of a random forest flattened into node arrays plus the scaler, inference with numpy only
+compact_file = "{symbol}_{ml_session}_simple_confirmation_bias_model.npz"
+
+# Lookup tables of the models over all inputs of the ML tab: greenbox (0/1) x open level x close level (0.0 - 1.0)
+grid_file = "{symbol}_{ml_session}_simple_confirmation_bias_grid.npz"
+grid_steps = 10
+
+
+def features_matrix(greenbox, opening_level, closing_level):
+    return np.column_stack([np.asarray(greenbox, dtype=float), np.asarray(opening_level, dtype=float),
+                            np.asarray(closing_level, dtype=float)])
+
+
+def predict_batch(model, scaler, greenbox, opening_level, closing_level, probability=False):
+    # Scores all days in one call (1.0 = long breakout or the probability of it), days with a missing feature get NaN
+    features = features_matrix(greenbox, opening_level, closing_level)
+    valid = ~np.isnan(features).any(axis=1)
+    predictions = np.full(len(features), np.nan)
+    if valid.any():
+        scaled = scaler.transform(features[valid])
+        if probability:
+            predictions[valid] = model.predict_proba(scaled)[:, list(model.classes_).index(True)]
+        else:
+            predictions[valid] = model.predict(scaled)
+    return predictions
+
+
+def export_compact_model(model, scaler, path):
+    # Node ids of all trees are shifted into one array, leaves point to themselves
+    trees = [estimator.tree_ for estimator in model.estimators_]
+    offsets = np.cumsum([0] + [tree.node_count for tree in trees])
+    left, right = [], []
+    for tree, offset in zip(trees, offsets):
+        leaf = tree.children_left < 0
+        nodes = np.arange(tree.node_count)
+        left.append(np.where(leaf, nodes, tree.children_left) + offset)
+        right.append(np.where(leaf, nodes, tree.children_right) + offset)
+    # leaf values normalized to class probabilities like DecisionTreeClassifier.predict_proba
+    value = np.concatenate([tree.value[:, 0, :] for tree in trees])
+    np.savez_compressed(
+        path,
+        roots=offsets[:-1].astype(np.int32),
+        left=np.concatenate(left).astype(np.int32),
+        right=np.concatenate(right).astype(np.int32),
+        feature=np.concatenate([tree.feature for tree in trees]).astype(np.int8),
+        threshold=np.concatenate([tree.threshold for tree in trees]),
+        value=value / value.sum(axis=1, keepdims=True),
+        classes=np.asarray(model.classes_),
+        scaler_mean=scaler.mean_,
+        scaler_scale=scaler.scale_,
+    )
+
+
+class CompactForest:
+    # predict/predict_proba of the exported random forest
+
+    def __init__(self, arrays):
+        for name in ["roots", "left", "right", "feature", "threshold", "value", "classes"]:
+            setattr(self, name, arrays[name])
+        self.classes_ = self.classes
+
+    def predict_proba(self, X):
+        # float32 inputs and the tree by tree sum of the probabilities like scikit-learn
+        X = np.asarray(X, dtype=np.float32)
+        nodes = np.tile(self.roots, (len(X), 1))
+        while True:
+            feature = self.feature[nodes]
+            inner = feature >= 0
+            if not inner.any():
+                break
+            x = np.take_along_axis(X, np.where(inner, feature, 0), axis=1)
+            nodes = np.where(inner, np.where(x <= self.threshold[nodes], self.left[nodes], self.right[nodes]), nodes)
+
+        proba = np.zeros((len(X), self.value.shape[1]))
+        for tree in range(nodes.shape[1]):
+            proba += self.value[nodes[:, tree]]
+        return proba / nodes.shape[1]
+
+    def predict(self, X):
+        return self.classes.take(np.argmax(self.predict_proba(X), axis=1))
+
+
+class CompactScaler:
+    def __init__(self, arrays):
+        self.mean_ = arrays["scaler_mean"]
+        self.scale_ = arrays["scaler_scale"]
+
+    def transform(self, X):
+        return (np.asarray(X, dtype=float) - self.mean_) / self.scale_
+
+
+def load_compact_model(path):
+    with np.load(path) as file:
+        arrays = {name: file[name] for name in file.files}
+    return CompactForest(arrays), CompactScaler(arrays)
+
+
+def grid_features():
+    # all inputs of the ML tab as greenbox, open level and close level columns in grid order
+    levels = np.array([step / grid_steps for step in range(grid_steps + 1)])
+    greenbox, opening, closing = np.meshgrid(np.arange(2), levels, levels, indexing="ij")
+    return greenbox.ravel(), opening.ravel(), closing.ravel()
+
+
+def build_prediction_grid(model, scaler):
+    # Predictions and long probabilities indexed by [greenbox, open level * 10, close level * 10]
+    shape = (2, grid_steps + 1, grid_steps + 1)
+    prediction = predict_batch(model, scaler, *grid_features()).reshape(shape).astype(np.int8)
+    probability = predict_batch(model, scaler, *grid_features(), probability=True).reshape(shape)
+    return {"prediction": prediction, "probability": probability.astype(np.float32)}
+
+
+class ModelRegistry:
+    # Loads every model/scaler pair once per process and keeps the least recently used pairs below max_bytes.
+    # Compact models are preferred over the pickles. Predictions are answered from the lookup grids if possible,
+    # the models are only loaded as fallback.
+
+    def __init__(self, folder="ml_models", max_bytes=256 * 1024 ** 2):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.models = OrderedDict()  # (symbol, ml_session) -> (model, scaler)
+        self.grids = {}  # (symbol, ml_session) -> lookup grid or None if there is no grid file
+        self.metrics = {}  # (symbol, ml_session) -> load time, size and usage of the pair
+        self.size = 0
+        self.lock = threading.RLock()
+
+    def model_path(self, symbol, ml_session, kind):
+        return os.path.join(self.folder, model_file.format(symbol=symbol, ml_session=ml_session, kind=kind))
+
+    def compact_path(self, symbol, ml_session):
+        return os.path.join(self.folder, compact_file.format(symbol=symbol, ml_session=ml_session))
+
+    def grid_path(self, symbol, ml_session):
+        return os.path.join(self.folder, grid_file.format(symbol=symbol, ml_session=ml_session))
+
+    def available(self):
+        keys = set()
+        for path in glob.glob(self.compact_path("*", "*")) + glob.glob(self.model_path("*", "*", "model")):
+            symbol, ml_session = os.path.basename(path).split("_")[:2]
+            if self.has_model(symbol, ml_session):
+                keys.add((symbol, ml_session))
+        return sorted(keys)
+
+    def has_pickle(self, symbol, ml_session):
+        return all(os.path.isfile(self.model_path(symbol, ml_session, kind)) for kind in ["model", "scaler"])
+
+    def has_model(self, symbol, ml_session):
+        return (os.path.isfile(self.grid_path(symbol, ml_session)) or os.path.isfile(self.compact_path(symbol, ml_session))
+                or self.has_pickle(symbol, ml_session))
+
+    def load_pickle(self, symbol, ml_session):
+        loaded = []
+        for kind in ["model", "scaler"]:
+            with open(self.model_path(symbol, ml_session, kind), "rb") as file:
+                loaded.append(pickle.load(file))
+        return tuple(loaded)
+
+    def get(self, symbol, ml_session):
+        # (model, scaler) or None if there is no trained model
+        key = (symbol, ml_session)
+        with self.lock:
+            if key in self.models:
+                self.models.move_to_end(key)
+                self.metrics[key]["hits"] += 1
+                return self.models[key]
+
+            start = t.perf_counter()
+            if os.path.isfile(self.compact_path(symbol, ml_session)):
+                model_format = "compact"
+                loaded = load_compact_model(self.compact_path(symbol, ml_session))
+                size = sum(array.nbytes for array in vars(loaded[0]).values() if isinstance(array, np.ndarray))
+            elif self.has_pickle(symbol, ml_session):
+                model_format = "pickle"
+                loaded = self.load_pickle(symbol, ml_session)
+                # the pickled size is used as memory estimate, the forests are mostly numpy arrays
+                size = sum(os.path.getsize(self.model_path(symbol, ml_session, kind)) for kind in ["model", "scaler"])
+            else:
+                return None
+
+            self.models[key] = loaded
+            self.size += size
+            metrics = self.metrics.setdefault(key, {"loads": 0, "hits": 0})
+            metrics.update({"format": model_format, "load_seconds": t.perf_counter() - start, "bytes": size,
+                            "loaded": True})
+            metrics["loads"] += 1
+
+            while self.size > self.max_bytes and len(self.models) > 1:
+                evicted, _ = self.models.popitem(last=False)
+                self.size -= self.metrics[evicted]["bytes"]
+                self.metrics[evicted]["loaded"] = False
+            return self.models[key]
+
+    def get_grid(self, symbol, ml_session):
+        key = (symbol, ml_session)
+        with self.lock:
+            if key not in self.grids:
+                path = self.grid_path(symbol, ml_session)
+                self.grids[key] = None
+                if os.path.isfile(path):
+                    start = t.perf_counter()
+                    with np.load(path) as grid:
+                        self.grids[key] = {name: grid[name] for name in grid.files}
+                    metrics = self.metrics.setdefault(key, {"loads": 0, "hits": 0})
+                    metrics["grid_load_seconds"] = t.perf_counter() - start
+                    metrics["grid_bytes"] = sum(array.nbytes for array in self.grids[key].values())
+            return self.grids[key]
+
+    def predict(self, symbol, ml_session, greenbox, opening_level, closing_level, probability=False):
+        # 1.0 = long breakout (or the probability of it), NaN for missing features or if there is no model
+        features = features_matrix(greenbox, opening_level, closing_level)
+        predictions = np.full(len(features), np.nan)
+        remaining = ~np.isnan(features).any(axis=1)
+
+        grid = self.get_grid(symbol, ml_session)
+        if grid is not None:
+            steps = np.where(remaining[:, None], features, 0) * [1, grid_steps, grid_steps]
+            index = np.rint(steps)
+            on_grid = (remaining & (np.abs(steps - index) < 1e-6).all(axis=1)
+                       & ((index >= 0) & (index <= [1, grid_steps, grid_steps])).all(axis=1))
+            index = index[on_grid].astype(np.int64)
+            table = grid["probability" if probability else "prediction"]
+            predictions[on_grid] = table[index[:, 0], index[:, 1], index[:, 2]]
+            remaining &= ~on_grid
+
+        # inputs outside of the grid are predicted by the model itself
+        if remaining.any():
+            loaded = self.get(symbol, ml_session)
+            if loaded is not None:
+                predictions[remaining] = predict_batch(*loaded, *features[remaining].T, probability=probability)
+        return predictions
+
+    def warm_up(self):
+        # Loads all grids (or the models without a grid) in a background thread, requests are served as usual
+        def load_all():
+            for key in self.available():
+                if self.get_grid(*key) is None:
+                    self.get(*key)
+
+        thread = threading.Thread(target=load_all, daemon=True)
+        thread.start()
+        return thread
+
+    def metrics_table(self):
+        with self.lock:
+            return [{"symbol": symbol, "model": ml_session, **metrics}
+                    for (symbol, ml_session), metrics in self.metrics.items()]
+
+    def export_compact_models(self):
+        for symbol, ml_session in self.available():
+            if not self.has_pickle(symbol, ml_session):
+                continue
+            model, scaler = self.load_pickle(symbol, ml_session)
+            path = self.compact_path(symbol, ml_session)
+            export_compact_model(model, scaler, path)
+
+            # the compact model has to reproduce the pickled model on all inputs of the ML tab
+            compact = load_compact_model(path)
+            for probability in [False, True]:
+                if not np.array_equal(predict_batch(model, scaler, *grid_features(), probability=probability),
+                                      predict_batch(*compact, *grid_features(), probability=probability)):
+                    os.remove(path)
+                    raise ValueError(f"{path} does not reproduce the predictions of the pickled model")
+            print(f"{path} written ({os.path.getsize(path) / 1024:.0f} KB)")
+
+    def export_grids(self):
+        for symbol, ml_session in self.available():
+            grid = build_prediction_grid(*self.get(symbol, ml_session))
+            np.savez_compressed(self.grid_path(symbol, ml_session), **grid)
+            print(f"{self.grid_path(symbol, ml_session)} written")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Writes the compact models and prediction lookup grids of all ML models")
+    parser.add_argument("--folder", default="ml_models")
+    args = parser.parse_args()
+    registry = ModelRegistry(args.folder)
+    registry.export_compact_models()
+    registry.export_grids()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+import argparse
+import os
+import sys
+import tempfile
+import time as t
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from multiprocessing import get_context
+
+import numpy as np
+import polars as pl
+from polars.testing import assert_frame_equal
+
+import backtest as bt
+import orb_calculations as oc
+from orb_labels import model_labels, window_columns, window_label
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return float("nan")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def run_ingestion(folder, mode):
+    start = t.perf_counter()
+    if mode == "eager":
+        data = oc.read_bars_eager(folder)
+    else:
+        data = oc.read_bars(folder, streaming=mode == "streaming")
+    return t.perf_counter() - start, peak_rss_mb(), data.height
+
+
+def run_isolated(func, *args):
+    # Every run gets a fresh interpreter, otherwise the peak RSS of a previous run would be reported again
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+        return pool.submit(func, *args).result()
+
+
+def benchmark_ingestion(args):
+    folder = args.folder or oc.symbol_dict.get(args.symbol)
+    print(f"Ingestion benchmark for {folder}")
+    for mode in ["eager", "lazy", "streaming"]:
+        for run in range(args.repeat):
+            seconds, rss, rows = run_isolated(run_ingestion, folder, mode)
+            print(f"{mode:>9} run {run + 1}: {seconds:8.3f} s  peak RSS {rss:9.1f} MB  {rows} bars")
+
+
+def benchmark_engines(args):
+    if args.folder:
+        oc.symbol_dict[args.symbol] = args.folder
+    orb = oc.OpeningRange(args.symbol, orb_duration=args.duration, engine="legacy")
+
+    tables = {}
+    for engine in ["legacy", "single_pass"]:
+        orb.engine = engine
+        for run in range(args.repeat):
+            start = t.perf_counter()
+            orb.orb_calculations()
+            print(f"{engine:>11} run {run + 1}: {t.perf_counter() - start:8.3f} s for all sessions")
+
+        orb.fib_level_calculations()
+        orb.model_builder()
+        orb.join_prev_models()
+        tables[engine] = {session: orb.get_single_orb_table(session) for session in orb.sessions}
+
+    # Regression check: both engines have to produce the same ORB tables
+    for session in orb.sessions:
+        assert_frame_equal(tables["single_pass"][session], tables["legacy"][session])
+    print("single_pass and legacy ORB tables are identical")
+
+
+def benchmark_backtests(args):
+    if args.folder:
+        oc.symbol_dict[args.symbol] = args.folder
+    orb = oc.OpeningRange(args.symbol, orb_duration=args.duration)
+    orb_table = orb.get_single_orb_table(args.session)
+    bars = orb.sessions[args.session]["5_min_session"]
+    days = orb_table.filter(pl.col("breakout_time").is_not_null() & (pl.col("upday") == (args.side == "long")))
+    days = days.sort("date")
+
+    start = t.perf_counter()
+    level_outcome, level_r = bt.level_outcomes(days, args.side, args.buy_in, args.sl, args.tp)
+    level_seconds = t.perf_counter() - start
+    start = t.perf_counter()
+    _, bar_outcome, bar_r = bt.bar_outcomes(bars, orb_table, args.side, args.buy_in, args.sl, args.tp)
+    bar_seconds = t.perf_counter() - start
+
+    level_kpis = bt.trade_kpis(level_outcome, level_r, args.buy_in, args.sl, args.tp)
+    bar_kpis = bt.trade_kpis(bar_outcome, bar_r, args.buy_in, args.sl, args.tp)
+    print(f"{args.symbol} {args.session} {args.duration} {args.side}: buy in {args.buy_in}, stop loss {args.sl}, "
+          f"take profit {args.tp}, {len(days)} breakout days")
+    print(f"{'':>16}{'level':>10}{'bar':>10}")
+    for name in level_kpis:
+        print(f"{name:>16}{level_kpis[name]:10.3f}{bar_kpis[name]:10.3f}")
+    print(f"{'seconds':>16}{level_seconds:10.3f}{bar_seconds:10.3f}")
+
+    # days with a different outcome, rows: level engine, columns: bar engine
+    outcomes = ["no trade", "stop loss", "take profit", "partial win", "partial loss"]
+    matrix = np.zeros((len(outcomes), len(outcomes)), dtype=int)
+    np.add.at(matrix, (level_outcome, bar_outcome), 1)
+    print(f"\n{'level / bar':>16}" + "".join(f"{name:>14}" for name in outcomes))
+    for name, row in zip(outcomes, matrix):
+        print(f"{name:>16}" + "".join(f"{count:14d}" for count in row))
+
+
+def baseline_orb_table(df, start_time, window_minutes):
+    # ORB table in the csv format of the first exports: unix timestamps (us), window labels and model names
+    return df.with_columns(
+        [pl.col(col).dt.convert_time_zone("UTC").dt.cast_time_unit("us").cast(pl.Int64) for col in oc.time_columns]
+        + [pl.col(col).map_elements(lambda bucket: window_label(bucket, start_time, window_minutes),
+                                    return_dtype=pl.String) for col in window_columns]
+        + [pl.col(col).replace_strict(dict(enumerate(model_labels)), default=None, return_dtype=pl.String)
+           for col in oc.model_columns]
+    )
+
+
+def benchmark_merge(args):
+    # Incremental build on top of tables in the format of the first exports. The window ids and model codes
+    # of the converted history have to equal the ones of a full build.
+    oc.symbol_dict[args.symbol] = os.path.abspath(args.folder or oc.symbol_dict[args.symbol])
+    orb = oc.OpeningRange(args.symbol, orb_duration=args.duration)
+    cutoff = orb.get_single_orb_table("ny")["date"].max() - timedelta(days=args.days)
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        # the ORB tables are read from and written to ./data
+        os.chdir(folder)
+        try:
+            os.mkdir("data")
+            for session in orb.sessions:
+                df = orb.get_single_orb_table(session).filter(pl.col("date") < cutoff)
+                df = baseline_orb_table(df, orb.sessions[session]["start_time"], orb.window_minutes)
+                df.write_csv(orb.orb_table_path(session), separator=";")
+            start = t.perf_counter()
+            merged = oc.OpeningRange(args.symbol, orb_duration=args.duration, incremental=True)
+            print(f"incremental build after {cutoff}: {t.perf_counter() - start:8.3f} s")
+        finally:
+            os.chdir(cwd)
+
+    columns = ["date"] + window_columns + oc.model_columns
+    for session in orb.sessions:
+        assert_frame_equal(merged.get_single_orb_table(session).select(columns),
+                           orb.get_single_orb_table(session).select(columns))
+    print("window ids and model codes of the merged baseline tables are unchanged")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the opening range calculations")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingestion = commands.add_parser("ingestion", help="Eager CSV loop vs. lazy scan")
+    ingestion.add_argument("--symbol", default="nq")
+    ingestion.add_argument("--folder", help="Folder with 5 minute CSV files (defaults to the symbol folder)")
+    ingestion.add_argument("--repeat", type=int, default=3)
+    ingestion.set_defaults(func=benchmark_ingestion)
+
+    engines = commands.add_parser("engine", help="Legacy join based vs. single pass ORB calculation")
+    engines.add_argument("--symbol", default="nq")
+    engines.add_argument("--folder", help="Folder with 5 minute CSV files (defaults to the symbol folder)")
+    engines.add_argument("--duration", type=int, default=60)
+    engines.add_argument("--repeat", type=int, default=3)
+    engines.set_defaults(func=benchmark_engines)
+
+    backtests = commands.add_parser("backtest", help="Level based vs. bar by bar Strategy Backtester")
+    backtests.add_argument("--symbol", default="nq")
+    backtests.add_argument("--folder", help="Folder with 5 minute CSV files (defaults to the symbol folder)")
+    backtests.add_argument("--duration", type=int, default=60)
+    backtests.add_argument("--session", default="ny", choices=["ny", "ldn", "asia"])
+    backtests.add_argument("--side", default="long", choices=["long", "short"])
+    backtests.add_argument("--buy-in", type=float, default=1.0)
+    backtests.add_argument("--sl", type=float, default=0.5)
+    backtests.add_argument("--tp", type=float, default=1.5)
+    backtests.set_defaults(func=benchmark_backtests)
+
+    merge = commands.add_parser("merge", help="Incremental build on top of ORB tables of the first csv format")
+    merge.add_argument("--symbol", default="nq")
+    merge.add_argument("--folder", help="Folder with 5 minute CSV files (defaults to the symbol folder)")
+    merge.add_argument("--duration", type=int, default=60)
+    merge.add_argument("--days", type=int, default=30, help="Days that are calculated by the incremental build")
+    merge.set_defaults(func=benchmark_merge)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,272 @@
 import time as t
+import numpy as np
 import polars as pl
+import pyarrow as pa
+import pyarrow.feather as feather
+import argparse
+import glob
 import os
+from orb_labels import session_start_times, model_codes, window_columns, window_bucket, no_window
+from session_cube import build_session_cube, cube_attributes, cube_file
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import time, timedelta, datetime
+from decimal import Decimal
 
 symbols = ["nq", "es", "ym", "cl", "gc", "eurusd", "gbpusd", "fdax", "audjpy",]
 
+# Opening range start times of the ny, ldn and asia session
+default_start_times = [session_start_times["ny"], session_start_times["ldn"], session_start_times["asia"]]
+
+# Folders with the raw 5 minute bars of each symbol
+symbol_dict = {
+    "nq": r"C:\Timon\Aktien\data\NQ\5Min",
+    "es": r"C:\Timon\Aktien\data\ES\5Min",
+    "ym": r"C:\Timon\Aktien\data\YM\5Min",
+    "cl": r"C:\Timon\Aktien\data\CL\5Min",
+    "gc": r"C:\Timon\Aktien\data\GC",
+    "eurusd": r"C:\Timon\Aktien\data\EURUSD\5Min",
+    "gbpusd": r"C:\Timon\Aktien\data\GBPUSD\5Min",
+    "fdax": r"C:\Timon\Aktien\data\FDAX\5Min",
+    "audjpy": r"C:\Timon\Aktien\data\AUDJPY\5min",
+}
+
+# Datetime columns of the ORB tables, exported as unix timestamps (us) if requested
+time_columns = ["up_confirmation", "down_confirmation", "breakout_time", "max_retracement_time", "max_expansion_time"]
+
+# Export formats that keep the dtypes of the ORB tables (read by the dashboard without any parsing)
+typed_formats = ["parquet", "feather"]
+
+
+# Segmented reductions over the bars of a day, starts are the row offsets of the days.
+# Days without any bar in mask get NaN.
+def segment_max(values, mask, starts):
+    day_max = np.maximum.reduceat(np.where(mask, values, -np.inf), starts)
+    return np.where(np.isneginf(day_max), np.nan, day_max)
+
+
+def segment_min(values, mask, starts):
+    day_min = np.minimum.reduceat(np.where(mask, values, np.inf), starts)
+    return np.where(np.isposinf(day_min), np.nan, day_min)
+
+
+def segment_first(values, mask, starts):
+    # value of the first bar in mask
+    position = np.minimum.reduceat(np.where(mask, np.arange(len(values)), len(values)), starts)
+    return np.where(position < len(values), values[np.minimum(position, len(values) - 1)], np.nan)
+
+
+def segment_last(values, mask, starts):
+    # value of the last bar in mask
+    position = np.maximum.reduceat(np.where(mask, np.arange(len(values)), -1), starts)
+    return np.where(position >= 0, values[position], np.nan)
+
+
+def time_window(col, session_start, minutes=15):
+    # window of a timestamp as minutes since the session start (labels in orb_labels.window_label)
+    session_minutes = session_start.hour * 60 + session_start.minute
+    return (((pl.col(col).dt.hour().cast(pl.Int16) * 60 + pl.col(col).dt.minute() - session_minutes) // minutes)
+            * minutes).cast(pl.Int16)
+
+
+def time_of_day(col):
+    # seconds since midnight in NY time, exported next to the timestamp as <col>_tod
+    ny_time = pl.col(col).dt.convert_time_zone("America/New_York")
+    return (ny_time.dt.hour().cast(pl.Int32) * 3600 + ny_time.dt.minute().cast(pl.Int32) * 60
+            + ny_time.dt.second().cast(pl.Int32)).alias(f"{col}_tod")
+
+
+def session_model():
+    # Model of the opening range compared to the range of the previous session as code of orb_labels.model_labels.
+    # The conditions exclude each other, so the code is the sum of code * condition (no when/then chain).
+    # Days without a matching condition (or previous session) get the "None" model.
+    low, high = pl.col("range_low"), pl.col("range_high")
+    low_prev, high_prev, midline_prev = pl.col("range_low_prev"), pl.col("range_high_prev"), pl.col("midline_prev_session")
+    conditions = {
+        "Weak Uptrend": (low <= midline_prev) & (low >= low_prev) & (high > high_prev),
+        "Medium Uptrend": (low > midline_prev) & (low <= high_prev) & (high > high_prev),
+        "Strong Uptrend": low > high_prev,
+        "Weak Downtrend": (high >= midline_prev) & (high <= high_prev) & (low < low_prev),
+        "Medium Downtrend": (high < midline_prev) & (high >= low_prev) & (low < low_prev),
+        "Strong Downtrend": high < low_prev,
+        "Contraction": (high < high_prev) & (low > low_prev),
+        "Expansion": (high > high_prev) & (low < low_prev),
+    }
+    return pl.sum_horizontal(
+        condition.fill_null(False).cast(pl.Int8) * pl.lit(model_codes[model], dtype=pl.Int8)
+        for model, condition in conditions.items()
+    ).cast(pl.Int8).alias("model")
+
+
+# Model columns of the ORB tables (int8 codes)
+model_columns = ["model", "model_prev"]
+
+
+# Fibonacci levels of the ORB table:
+# (level column, source column on long days, source column on short days, range anchor, rounding on long days)
+fib_levels = [
+    ("expansion_level", "max_expansion_value", "max_expansion_value", "wick", "floor"),
+    ("expansion_level_body", "max_expansion_value", "max_expansion_value", "body", "floor"),
+    ("retracement_level", "max_retracement_value", "max_retracement_value", "wick", "ceil"),
+    ("retracement_level_body", "max_retracement_value", "max_retracement_value", "body", "ceil"),
+    ("after_conf_max_level", "after_conf_max", "after_conf_min", "wick", "ceil"),
+    ("after_conf_min_level", "after_conf_min", "after_conf_max", "wick", "ceil"),
+    ("opening_level", "range_open", "range_open", "wick", "ceil"),
+    ("closing_level", "range_close", "range_close", "wick", "ceil"),
+    ("session_close_level", "session_close", "session_close", "wick", "ceil"),
+    ("session_low_level", "session_low", "session_low", "wick", "ceil"),
+    ("session_high_level", "session_high", "session_high", "wick", "ceil"),
+]
+
+# range low and range width column of the wick and body range
+range_anchors = {
+    "wick": ("range_low", "range_width"),
+    "body": ("range_low_body", "range_width_body"),
+}
+
+# Parquet store with the imported bars, partitioned by symbol and year: bar_store/{symbol}/year={year}/bars.parquet
+bar_store = "bar_store"
+
+
+def read_bars_eager(folder):
+    data = pl.DataFrame()
+    # loop through all files in folder and merge into one file
+    for file in os.scandir(folder):
+        file_df = pl.read_csv(file.path, separator=",",
+                              columns=[0, 1, 2, 3, 4])  # columns=["time", "open", "high", "low", "close"]
+
+        if file_df["time"].dtype == pl.Int64:
+            file_df = file_df.with_columns(
+                file_df.select(pl.from_epoch(pl.col("time"), time_unit="s").dt.convert_time_zone("America/New_York")))
+        else:
+            # Konvertiere die Spalte 'time' in das datetime-Format
+            file_df = file_df.with_columns(
+                pl.col("time").str.strptime(pl.Datetime)
+                    .dt.convert_time_zone("America/New_York")
+                    .alias("time")
+            )
+
+        data = pl.concat([data, file_df])
+
+    data = data.unique(subset="time")
+    data = data.sort(by="time")
+    return data
+
+
+def scan_bars(folder):
+    return scan_bar_files(sorted(glob.glob(os.path.join(folder, "*"))))
+
+
+def scan_bar_files(paths):
+    # Every file is scanned with its first five columns (files can have different extra columns), the dtype
+    # polars infers for the time column tells unix seconds from datetime strings.
+    # Nothing is read until the plan gets collected.
+    scans = []
+    for path in paths:
+        file_lf = pl.scan_csv(path, separator=",")
+        schema = file_lf.collect_schema()
+        file_lf = file_lf.select(schema.names()[:5])  # ["time", "open", "high", "low", "close"]
+
+        if schema.dtypes()[0] == pl.Int64:
+            time_col = pl.from_epoch(pl.col("time"), time_unit="s")
+        else:
+            time_col = pl.col("time").str.strptime(pl.Datetime)
+
+        scans.append(file_lf.with_columns(
+            time_col.dt.convert_time_zone("America/New_York").alias("time")
+        ))
+
+    return pl.concat(scans, how="vertical_relaxed").unique(subset="time").sort(by="time")
+
+
+def read_bars(folder, streaming=False):
+    # Dedup and sort of all files happen in a single collect
+    return scan_bars(folder).collect(streaming=streaming)
+
+
+def load_bars(symbol, ingestion="lazy", store=bar_store, start_date=None):
+    # Use the parquet bar store if the symbol has been imported, otherwise parse the raw CSV folder
+    if store is not None and os.path.isdir(os.path.join(store, symbol)):
+        update_bar_store(symbol, store=store)
+        return scan_bar_store(symbol, store, start_date).collect()
+
+    folder = symbol_dict.get(symbol)
+    if ingestion == "eager":
+        data = read_bars_eager(folder)
+    else:
+        data = read_bars(folder, streaming=ingestion == "streaming")
+
+    if start_date is not None:
+        data = data.filter(pl.col("time").dt.date() >= start_date)
+    return data
+
+
+def import_bars_to_store(symbol, folder=None, store=bar_store):
+    # One-shot import of the raw CSV folder of a symbol into the parquet bar store
+    data = read_bars(folder or symbol_dict.get(symbol))
+    data = data.with_columns(pl.col("time").dt.year().alias("year"))
+
+    for (year,), year_df in data.group_by("year"):
+        path = os.path.join(store, symbol, f"year={year}")
+        os.makedirs(path, exist_ok=True)
+        year_df.drop("year").sort("time").write_parquet(os.path.join(path, "bars.parquet"))
+
+
+def update_bar_store(symbol, folder=None, store=bar_store):
+    # Appends the bars of the CSV files changed since the last import/update to the store.
+    # Only these files are parsed and only the partitions of the new bars get rewritten.
+    folder = folder or symbol_dict.get(symbol)
+    if folder is None or not os.path.isdir(folder):
+        return
+    partitions = glob.glob(os.path.join(store, symbol, "*", "bars.parquet"))
+    last_update = max(os.path.getmtime(path) for path in partitions)
+    paths = [path for path in sorted(glob.glob(os.path.join(folder, "*"))) if os.path.getmtime(path) > last_update]
+    if not paths:
+        return
+
+    last_bar = scan_bar_store(symbol, store).select(pl.col("time").max()).collect().item()
+    data = scan_bar_files(paths).filter(pl.col("time") > last_bar).collect()
+    data = data.with_columns(pl.col("time").dt.year().alias("year"))
+
+    for (year,), year_df in data.group_by("year"):
+        path = os.path.join(store, symbol, f"year={year}")
+        os.makedirs(path, exist_ok=True)
+        file_name = os.path.join(path, "bars.parquet")
+        year_df = year_df.drop("year")
+        if os.path.isfile(file_name):
+            year_df = pl.concat([pl.read_parquet(file_name), year_df], how="vertical_relaxed")
+        year_df.unique(subset="time").sort("time").write_parquet(file_name)
+
+
+def scan_bar_store(symbol, store=bar_store, start_date=None):
+    lf = pl.scan_parquet(os.path.join(store, symbol, "*", "*.parquet"), hive_partitioning=True)
+    if start_date is not None:
+        # The year predicate prunes whole partitions, the time predicate is pushed into the parquet reader
+        start = pl.lit(datetime.combine(start_date, time(0, 0))).dt.replace_time_zone("America/New_York")
+        lf = lf.filter(
+            (pl.col("year") >= start_date.year) &
+            (pl.col("time") >= start)
+        )
+    return lf.drop("year")
+
+
 class OpeningRange:
-    def __init__(self, symbol, orb_duration=60, start_times=None):
+    def __init__(self, symbol, orb_duration=60, start_times=None, ingestion="lazy", bar_store=bar_store,
+                 start_date=None, incremental=False, lookback_days=7, data=None, engine="single_pass",
+                 level_bucket=0.1, exact_levels=False, levels=None, window_minutes=15):
         if start_times is None:
-            start_times = [time(9, 30), time(3, 00), time(8, 30)]
+            start_times = default_start_times
         self.orb_duration = orb_duration
+        self.start_times = start_times
+        self.engine = engine
+        self.level_bucket = level_bucket
+        self.window_minutes = window_minutes
+        self.exact_levels = exact_levels
+        self.fib_levels = fib_levels if levels is None else levels
         self.symbol = symbol
-        self.symbol_dict = {
-            "nq": r"C:\Timon\Aktien\data\NQ\5Min",
-            "es": r"C:\Timon\Aktien\data\ES\5Min",
-            "ym": r"C:\Timon\Aktien\data\YM\5Min",
-            "cl": r"C:\Timon\Aktien\data\CL\5Min",
-            "gc": r"C:\Timon\Aktien\data\GC",
-            "eurusd": r"C:\Timon\Aktien\data\EURUSD\5Min",
-            "gbpusd": r"C:\Timon\Aktien\data\GBPUSD\5Min",
-            "fdax": r"C:\Timon\Aktien\data\FDAX\5Min",
-            "audjpy": r"C:\Timon\Aktien\data\AUDJPY\5min",
-        }
+        self.ingestion = ingestion
+        self.bar_store = bar_store
+        self.start_date = start_date
+        self.symbol_dict = symbol_dict
         self.sessions = {
             "ny": {"start_time": start_times[0],
                    "end_time": (datetime.combine(datetime.today(), start_times[0]) + timedelta(minutes=orb_duration)).time(),
@@ -45,37 +290,34 @@ class OpeningRange:
                      "model_df": pl.DataFrame,
                      "prev_session": "ny"},
         }
-        self.data = self.create_dataset()
+        # Incremental mode: only the bars after the last exported day (plus some days for the previous
+        # session models) are processed and the new rows get merged into the existing ORB tables.
+        self.existing_tables = {}
+        if incremental:
+            self.existing_tables = self.load_orb_tables()
+            if len(self.existing_tables) == len(self.sessions):
+                last_date = min(df["date"].max() for df in self.existing_tables.values())
+                self.start_date = last_date - timedelta(days=lookback_days)
+            else:
+                # Not every session has been exported yet -> full rebuild
+                self.existing_tables = {}
+
+        if data is None:
+            self.data = self.create_dataset()
+        elif self.start_date is not None:
+            self.data = data.filter(pl.col("time").dt.date() >= self.start_date)
+        else:
+            # bars already loaded by the caller (e.g. shared between durations in the batch build)
+            self.data = data
         self.session_calculations()
         self.orb_calculations()
         self.fib_level_calculations()
         self.model_builder()
         self.join_prev_models()
+        self.merge_existing_orb_tables()
 
     def create_dataset(self):
-        data = pl.DataFrame()
-        # loop through all files in folder and merge into one file
-        for file in os.scandir(self.symbol_dict.get(self.symbol)):
-            file_df = pl.read_csv(file.path, separator=",",
-                                  columns=[0, 1, 2, 3, 4])  # columns=["time", "open", "high", "low", "close"]
-
-            if file_df["time"].dtype == pl.Int64:
-                file_df = file_df.with_columns(
-                    file_df.select(pl.from_epoch(pl.col("time"), time_unit="s").dt.convert_time_zone("America/New_York")))
-            else:
-                # Konvertiere die Spalte 'time' in das datetime-Format
-                file_df = file_df.with_columns(
-                    pl.col("time").str.strptime(pl.Datetime)
-                        .dt.convert_time_zone("America/New_York")
-                        .alias("time")
-                )
-
-            data = pl.concat([data, file_df])
-
-
-        data = data.unique(subset="time")
-        data = data.sort(by="time")
-        return data
+        return load_bars(self.symbol, self.ingestion, self.bar_store, self.start_date)
 
     def export_dataset(self, file_name=None, time_definition="datetime", time_unit="s"):
         time_definition = str(time_definition).lower()
@@ -94,600 +336,716 @@ class OpeningRange:
     def get_single_orb_table(self, session):
         return self.sessions[session]["orb_table"]
 
+    def orb_table_path(self, session, file_format="csv"):
+        file_name = f"{self.symbol}_{session}_{self.orb_duration}"
+        if self.start_times != default_start_times:
+            # custom opening range start -> keep the default tables untouched
+            file_name += f"_{self.sessions[session]['start_time'].strftime('%H%M')}"
+        return os.path.join("data", f"{file_name}.{file_format}")
+
+    def session_cube_path(self):
+        file_name, extension = os.path.splitext(cube_file.format(symbol=self.symbol, orb_duration=self.orb_duration))
+        if self.start_times != default_start_times:
+            file_name += "_" + "_".join(start_time.strftime("%H%M") for start_time in self.start_times)
+        return os.path.join("data", file_name + extension)
+
+    def export_session_cube(self):
+        # asia -> ldn -> ny state counts for the Model Section of the dashboard
+        tables = {session: self.sessions[session]["orb_table"].select(["date"] + cube_attributes).to_pandas()
+                  .set_index("date") for session in self.sessions}
+        build_session_cube(tables).save(self.session_cube_path())
+
     def export_all_orb_tables(self, unix=False, file_format="csv"):
         for session in self.sessions:
             df = self.sessions[session]["orb_table"]
+            filename = self.orb_table_path(session, file_format)
+
+            # Time of day columns are placed behind their timestamp (and replaced if merged from an older export)
+            df = df.drop([f"{col}_tod" for col in time_columns], strict=False)
+            columns = []
+            for col in df.columns:
+                columns.append(pl.col(col))
+                if col in time_columns:
+                    columns.append(time_of_day(col))
+            df = df.select(columns)
+
+            if file_format in typed_formats:
+                # Typed formats keep bool, date, timestamp and model code dtypes, strings are dictionary encoded
+                df = df.with_columns(pl.col(pl.String).cast(pl.Categorical))
+                if file_format == "parquet":
+                    df.write_parquet(filename)
+                else:
+                    # pandas can not read the unsigned dictionary indices polars uses for categoricals
+                    table = df.to_arrow()
+                    table = table.cast(pa.schema([
+                        pa.field(field.name, pa.dictionary(pa.int32(), pa.string()))
+                        if pa.types.is_dictionary(field.type) else field
+                        for field in table.schema
+                    ]))
+                    feather.write_feather(table, filename)
+                continue
 
             if unix:
                 df = df.with_columns(
-                    (pl.col("up_confirmation").dt.convert_time_zone("UTC").dt.cast_time_unit("us").cast(pl.Int64).alias("up_confirmation")),
-                    (pl.col("down_confirmation").dt.convert_time_zone("UTC").dt.cast_time_unit("us").cast(pl.Int64).alias("down_confirmation")),
-                    (pl.col("breakout_time").dt.convert_time_zone("UTC").dt.cast_time_unit("us").cast(pl.Int64).alias("breakout_time")),
-                   # (pl.col("breakout_time").cast(pl.Int64).alias("breakout_time")),
-                    (pl.col("max_retracement_time").dt.convert_time_zone("UTC").dt.cast_time_unit("us").cast(pl.Int64).alias("max_retracement_time")),
-                    (pl.col("max_expansion_time").dt.convert_time_zone("UTC").dt.cast_time_unit("us").cast(pl.Int64).alias("max_expansion_time")),
+                    pl.col(col).dt.convert_time_zone("UTC").dt.cast_time_unit("us").cast(pl.Int64).alias(col)
+                    for col in time_columns
                 )
 
-            filename = os.path.join("data", f"{self.symbol}_{session}_{self.orb_duration}.{file_format}")
             if file_format == "xlsx":
                 df.write_excel(filename)
             elif file_format == "csv":
                 df.write_csv(filename, separator=";")
             else:
-                print("Not supported format. Please choose csv or xlsx")
+                print("Not supported format. Please choose csv, xlsx, parquet or feather")
+
+    def load_orb_tables(self):
+        # Typed exports are preferred over csv if a table was exported in several formats
+        tables = {}
+        for session in self.sessions:
+            for file_format in typed_formats + ["csv"]:
+                filename = self.orb_table_path(session, file_format)
+                if not os.path.isfile(filename):
+                    continue
+                if file_format == "parquet":
+                    tables[session] = pl.read_parquet(filename)
+                elif file_format == "feather":
+                    tables[session] = pl.read_ipc(filename, memory_map=False)
+                else:
+                    tables[session] = pl.read_csv(filename, separator=";", try_parse_dates=True)
+                break
+        return tables
+
+    def merge_existing_orb_tables(self):
+        for session, existing in self.existing_tables.items():
+            df = self.sessions[session]["orb_table"]
+
+            # The last exported day might have been incomplete, it gets replaced by the new calculation
+            last_date = existing["date"].max()
+            existing = existing.filter(pl.col("date") < last_date)
+            df = df.filter(pl.col("date") >= last_date)
+
+            # Bring the exported columns back to the dtypes of the calculation (unix timestamps, csv inference)
+            casts = []
+            for col in existing.columns:
+                if col not in df.columns or existing.schema[col] == df.schema[col]:
+                    continue
+                if col in time_columns and existing.schema[col].is_integer():
+                    casts.append(pl.from_epoch(pl.col(col), time_unit="us").dt.replace_time_zone("UTC")
+                                 .dt.convert_time_zone(df.schema[col].time_zone))
+                elif col in time_columns and isinstance(existing.schema[col], pl.Datetime):
+                    casts.append(pl.col(col).dt.convert_time_zone(df.schema[col].time_zone))
+                elif col in model_columns and existing.schema[col] in (pl.String, pl.Categorical):
+                    # tables exported before the model codes contain the model names
+                    casts.append(pl.col(col).cast(pl.String).replace_strict(model_codes, default=None,
+                                                                            return_dtype=pl.Int8))
+                elif col in window_columns and existing.schema[col] in (pl.String, pl.Categorical):
+                    # tables exported before the integer windows contain "HH:MM - HH:MM" labels
+                    start_time = self.sessions[session]["start_time"]
+                    buckets = {label: no_window if label == "No Breakout" else window_bucket(label, start_time)
+                               for label in existing[col].cast(pl.String).drop_nulls().unique()}
+                    casts.append(pl.col(col).cast(pl.String).replace_strict(buckets, default=None,
+                                                                            return_dtype=pl.Int16))
+                else:
+                    casts.append(pl.col(col).cast(df.schema[col], strict=False))
+            converted = existing.with_columns(casts)
+
+            # A value that can not be converted would silently become null -> fail instead of dropping history
+            for col in converted.columns:
+                lost = converted[col].null_count() - existing[col].null_count()
+                if lost:
+                    raise ValueError(f"{lost} values of {col} in the exported {session} table can not be converted "
+                                     f"from {existing.schema[col]} to {df.schema[col]}")
+            existing = converted
+
+            merged = pl.concat([existing, df], how="diagonal_relaxed")
+            merged = merged.select(df.columns + [col for col in existing.columns if col not in df.columns])
+            self.sessions[session]["orb_table"] = merged.sort("date")
 
     def session_calculations(self):
+        # Columns that do not depend on the session and the open prices are calculated once for all sessions
+        df_all = self.data.with_columns(
+            (pl.max_horizontal(["open", "close"])).alias("body_high"),
+            (pl.min_horizontal(["open", "close"])).alias("body_low"),
+
+            (pl.col("time").dt.date().alias("date")),
+
+            (pl.col("time")
+             .dt.convert_time_zone("UTC")  # Konvertiere in UTC
+             ).alias("utc_datetime"),
+        )
+        df_all = df_all.with_columns(
+            (pl.col("utc_datetime").dt.time() == time(0, 0)).alias("midnight_utc"),  # 00:00 Uhr UTC
+            (pl.col("time").dt.time() == time(0, 0)).alias("midnight_ny"),  # data is already in EST
+        )
+
+        #Open Price here
+        # NY midnight is 13:00/14:00 in Tokyo, so the NY dates are the asia dates as well
+        open_price_ny = df_all.filter(pl.col("midnight_ny")).group_by("date").agg([
+            pl.col("open").first().alias("ny_true_open"),
+        ])
+
+        open_price_day = df_all.filter(pl.col("midnight_utc")).group_by("utc_datetime").agg([
+                pl.col("open").last().alias("day_open"),
+        ])
+
+        open_price_day = open_price_day.with_columns(
+            pl.col("utc_datetime").dt.date().alias("date")
+        ).drop("utc_datetime")
+
+        open_prices = open_price_day.join(open_price_ny, left_on="date", right_on="date", how="left")
 
         for session in self.sessions:
 
-            df = self.data
+            df = df_all
 
             if session == "asia":
                 # Convert to Asia time zone if we have asia session
-                df = self.data.with_columns(
+                df = df_all.with_columns(
                     pl.col("time").dt.convert_time_zone("Asia/Tokyo")
                         .alias("time")
+                ).with_columns(
+                    pl.col("time").dt.date().alias("date")
                 )
 
+            # Only the session masks are evaluated per session
             df = df.with_columns(
                 ((pl.col("time").dt.time() >= self.sessions[session]["start_time"]) &
                  (pl.col("time").dt.time() < self.sessions[session]["end_time"])).alias("opening_range"),
 
                 ((pl.col("time").dt.time() >= self.sessions[session]["end_time"]) &
                  (pl.col("time").dt.time() < self.sessions[session]["end_of_session"])).alias("session"),
-
-                (pl.max_horizontal(["open", "close"])).alias("body_high"),
-                (pl.min_horizontal(["open", "close"])).alias("body_low"),
-
-                (pl.col("time").dt.date().alias("date")),
-
-                (pl.col("time")
-                 .dt.convert_time_zone("UTC")  # Konvertiere in UTC
-                 .dt.time()  # Extrahiere die Zeitkomponente
-                 == time(0, 0))  # Vergleiche mit 00:00 Uhr
-                    .alias("midnight_utc"),  # Alias für die neue Spalte,
-
-                (pl.col("time")
-                 .dt.convert_time_zone("America/New_York")  # Konvertiere in EST
-                 .dt.time()  # Extrahiere die Zeitkomponente
-                 == time(0, 0))  # Vergleiche mit 00:00 Uhr
-                    .alias("midnight_ny"),  # Alias für die neue Spalte,
-
-                (pl.col("time")
-                 .dt.convert_time_zone("UTC")  # Konvertiere in UTC
-                 )  # Vergleiche mit 00:00 Uhr
-                    .alias("utc_datetime"),  # Alias für die neue Spalte,
             )
 
-            #Open Price here
-            open_price_ny = df.filter(pl.col("midnight_ny")).group_by("date").agg([
-                pl.col("open").first().alias("ny_true_open"),
-            ])
-
-            open_price_day = df.filter(pl.col("midnight_utc")).group_by("utc_datetime").agg([
-                    pl.col("open").last().alias("day_open"),
-            ])
-
-            open_price_day = open_price_day.with_columns(
-                pl.col("utc_datetime").dt.date().alias("date")
-            ).drop("utc_datetime")
-
-
-
             df = df.filter(
                 (pl.col("session")) | (pl.col("opening_range"))
-            )
+            ).select(["time", "open", "high", "low", "close", "opening_range", "session", "body_high", "body_low",
+                      "date", "midnight_utc", "midnight_ny", "utc_datetime"])
+
             self.sessions[session]["5_min_session"] = df
-            self.sessions[session]["open_prices"] = open_price_day.join(open_price_ny, left_on="date", right_on="date", how="left")
+            self.sessions[session]["open_prices"] = open_prices
 
     def orb_calculations(self):
 
         for session in self.sessions:
-            # 5min session table
-            df = self.sessions[session]["5_min_session"]
-
-            # ORB Table
-            orb_df = df.filter(pl.col("opening_range")).group_by(["date"]).agg([
-                pl.col("high").max().alias("range_high"),
-                pl.col("low").min().alias("range_low"),
-                pl.col("body_high").max().alias("range_high_body"),
-                pl.col("body_low").min().alias("range_low_body"),
-                pl.col("open").first().alias("range_open"),
-                pl.col("close").last().alias("range_close")
-            ])
-
-            orb_df = orb_df.with_columns([
-                (pl.col("range_open") < pl.col("range_close")).alias("greenbox"),
-                (pl.col("range_high") - pl.col("range_low")).round(6).alias("range_size")
-            ])
-
-            # create session_table
-            session_table = df.filter(pl.col("session")).group_by(["date"]).agg([
-                pl.col("high").max().alias("session_high"),
-                pl.col("low").min().alias("session_low"),
-                pl.col("body_high").max().alias("session_body_high"),
-                pl.col("body_low").min().alias("session_body_low"),
-                pl.col("close").last().alias("session_close")
-            ])
-
-            # Join ORB table with sesion table
-            orb_df = orb_df.join(session_table, left_on="date", right_on="date")
-
-            orb_df = orb_df.with_columns([
-                (pl.col("range_high") < pl.col("session_high")).alias("breached_range_high"),
-                (pl.col("range_low") > pl.col("session_low")).alias("breached_range_low"),
-                (pl.col("range_high") < pl.col("session_body_high")).alias("closed_above_range_high"),
-                (pl.col("range_low") > pl.col("session_body_low")).alias("closed_below_range_low"),
-            ])
-            orb_df = orb_df.with_columns([
-                (pl.col("closed_above_range_high") | pl.col("closed_below_range_low")).alias("range_confirmed"),
-                (pl.col("closed_above_range_high") ^ pl.col("closed_below_range_low")).alias("range_holds_close"),
-                (pl.col("breached_range_low") ^ pl.col("breached_range_high")).alias("range_holds_wick"),
-            ])
-            # Remove days where ORB high == ORB low
-            orb_df = orb_df.filter(pl.col("range_high") != pl.col("range_low"))
-
-
-            ##########################################################
-            ### ORB CONFIRMATION CALCULATION
-            #########################################################
-
-            df = df.join(orb_df[["date", "range_high", "range_low"]], left_on="date", right_on="date")
-
-            df = df.with_columns([
-                (pl.col("close") > pl.col("range_high")).alias("long_breakout"),
-                (pl.col("close") < pl.col("range_low")).alias("short_breakout"),
-            ])
-            #df.write_csv("test.csv", separator=";")
-            long_df = df.filter(
-                (pl.col("long_breakout")) &
-                (pl.col("session"))
-            ).group_by(["date"]).agg([
-                pl.col("time").first().alias("up_confirmation"),
-            ])
-
-            short_df = df.filter(
-                (pl.col("short_breakout")) &
-                (pl.col("session"))
-            ).group_by(["date"]).agg([
-                pl.col("time").first().alias("down_confirmation"),
-            ])
-            # short_df.write_csv("short.csv", separator=";")
-            # long_df.write_csv("long.csv", separator=";")
-
-            orb_df = orb_df.join(long_df, left_on="date", right_on="date", how="left")
-            orb_df = orb_df.join(short_df, left_on="date", right_on="date", how="left")
-            orb_df.write_csv("orb2.csv", separator=";")
-            orb_df = orb_df.with_columns(
-                pl.min_horizontal(["up_confirmation", "down_confirmation"]).alias("breakout_time")
-            )
-
-
-            orb_df = orb_df.with_columns(
-                (pl.col("breakout_time") - (pl.col("breakout_time").dt.minute() % 15) * pl.duration(minutes=1))
-                    .dt.strftime("%H:%M")
-                    .alias("breakout_window_start"),
-                (pl.col("breakout_time") - (pl.col("breakout_time").dt.minute() % 15) * pl.duration(
-                    minutes=1) + pl.duration(minutes=15))
-                    .dt.strftime("%H:%M")
-                    .alias("breakout_window_end")
-            )
-
-            orb_df = orb_df.with_columns(
-                pl.concat_str([
-                    pl.col("breakout_window_start"),
-                    pl.lit(" - "),
-                    pl.col("breakout_window_end")
-                ]).alias("breakout_window")
-            )
-
-            orb_df = orb_df.drop(["breakout_window_start", "breakout_window_end"])
-
-            # ORB Upday Calculation
-            orb_df = orb_df.with_columns(
-                pl.when(pl.col("up_confirmation").is_null() & pl.col("down_confirmation").is_null())
-                    .then(False)
+            if self.engine == "legacy":
+                orb_df = self.orb_table_legacy(session)
+            else:
+                orb_df = self.orb_table_single_pass(session)
+
+            self.sessions[session]["orb_table"] = self.open_price_calculations(orb_df, session)
+
+    def orb_table_legacy(self, session):
+        # Reference implementation: every statistic is a filter -> group_by -> join round trip on the 5min bars
+        start_time = self.sessions[session]["start_time"]
+        # 5min session table
+        df = self.sessions[session]["5_min_session"]
+
+        # ORB Table
+        orb_df = df.filter(pl.col("opening_range")).group_by(["date"]).agg([
+            pl.col("high").max().alias("range_high"),
+            pl.col("low").min().alias("range_low"),
+            pl.col("body_high").max().alias("range_high_body"),
+            pl.col("body_low").min().alias("range_low_body"),
+            pl.col("open").first().alias("range_open"),
+            pl.col("close").last().alias("range_close")
+        ])
+
+        orb_df = orb_df.with_columns([
+            (pl.col("range_open") < pl.col("range_close")).alias("greenbox"),
+            (pl.col("range_high") - pl.col("range_low")).round(6).alias("range_size")
+        ])
+
+        # create session_table
+        session_table = df.filter(pl.col("session")).group_by(["date"]).agg([
+            pl.col("high").max().alias("session_high"),
+            pl.col("low").min().alias("session_low"),
+            pl.col("body_high").max().alias("session_body_high"),
+            pl.col("body_low").min().alias("session_body_low"),
+            pl.col("close").last().alias("session_close")
+        ])
+
+        # Join ORB table with sesion table
+        orb_df = orb_df.join(session_table, left_on="date", right_on="date")
+
+        orb_df = orb_df.with_columns([
+            (pl.col("range_high") < pl.col("session_high")).alias("breached_range_high"),
+            (pl.col("range_low") > pl.col("session_low")).alias("breached_range_low"),
+            (pl.col("range_high") < pl.col("session_body_high")).alias("closed_above_range_high"),
+            (pl.col("range_low") > pl.col("session_body_low")).alias("closed_below_range_low"),
+        ])
+        orb_df = orb_df.with_columns([
+            (pl.col("closed_above_range_high") | pl.col("closed_below_range_low")).alias("range_confirmed"),
+            (pl.col("closed_above_range_high") ^ pl.col("closed_below_range_low")).alias("range_holds_close"),
+            (pl.col("breached_range_low") ^ pl.col("breached_range_high")).alias("range_holds_wick"),
+        ])
+        # Remove days where ORB high == ORB low
+        orb_df = orb_df.filter(pl.col("range_high") != pl.col("range_low"))
+
+
+        ##########################################################
+        ### ORB CONFIRMATION CALCULATION
+        #########################################################
+
+        df = df.join(orb_df[["date", "range_high", "range_low"]], left_on="date", right_on="date")
+
+        df = df.with_columns([
+            (pl.col("close") > pl.col("range_high")).alias("long_breakout"),
+            (pl.col("close") < pl.col("range_low")).alias("short_breakout"),
+        ])
+        #df.write_csv("test.csv", separator=";")
+        long_df = df.filter(
+            (pl.col("long_breakout")) &
+            (pl.col("session"))
+        ).group_by(["date"]).agg([
+            pl.col("time").first().alias("up_confirmation"),
+        ])
+
+        short_df = df.filter(
+            (pl.col("short_breakout")) &
+            (pl.col("session"))
+        ).group_by(["date"]).agg([
+            pl.col("time").first().alias("down_confirmation"),
+        ])
+        # short_df.write_csv("short.csv", separator=";")
+        # long_df.write_csv("long.csv", separator=";")
+
+        orb_df = orb_df.join(long_df, left_on="date", right_on="date", how="left")
+        orb_df = orb_df.join(short_df, left_on="date", right_on="date", how="left")
+        orb_df = orb_df.with_columns(
+            pl.min_horizontal(["up_confirmation", "down_confirmation"]).alias("breakout_time")
+        )
+
+
+        orb_df = orb_df.with_columns(
+            time_window("breakout_time", start_time, self.window_minutes).alias("breakout_window")
+        )
+
+        # ORB Upday Calculation
+        orb_df = orb_df.with_columns(
+            pl.when(pl.col("up_confirmation").is_null() & pl.col("down_confirmation").is_null())
+                .then(False)
+                .otherwise(
+                pl.when(pl.col("up_confirmation").is_not_null() & pl.col("down_confirmation").is_null())
+                    .then(True)
                     .otherwise(
-                    pl.when(pl.col("up_confirmation").is_not_null() & pl.col("down_confirmation").is_null())
+                    pl.when(pl.col("up_confirmation") < pl.col("down_confirmation"))
                         .then(True)
-                        .otherwise(
-                        pl.when(pl.col("up_confirmation") < pl.col("down_confirmation"))
-                            .then(True)
-                            .otherwise(False)
-                    )
-                ).alias("upday"))
-            # ORB True
-            orb_df = orb_df.with_columns(
-                (pl.col("up_confirmation").is_null() | pl.col("down_confirmation").is_null()).alias("range_holds"),
-
-            )
-            # Close OUTSIDE ORB
-            orb_df = orb_df.with_columns(
-                pl.when(pl.col("upday") & (pl.col("session_close") > pl.col("range_high")))
-                    .then(True)
-                    .when(~pl.col("upday") & (pl.col("session_close") < pl.col("range_low")))
-                    .then(True)
-                    .otherwise(False)
-                    .alias("close_outside_range")
-            )
-
-            ##########################################################
-            ### PRE CONFIRMATION CALCULATION
-            #########################################################
-
-            df = df.join(orb_df[["date", "breakout_time"]], left_on="date", right_on="date")
-
-            df = df.with_columns(
-                (pl.col("time") < pl.col("breakout_time")).alias("before_breakout"),
-                (pl.col("time") > pl.col("breakout_time")).alias("after_breakout")
-            )
-
-            group_df = df.filter((pl.col("before_breakout")) &
-                                 (pl.col("session"))) \
-                .group_by(["date"]).agg([
-                pl.col("low").min().alias("pre_conf_min"),
-                pl.col("high").max().alias("pre_conf_max")
-            ])
-
-            orb_df = orb_df.join(group_df[["date", "pre_conf_min", "pre_conf_max"]], left_on="date", right_on="date",
-                               how="left")
-
-
-
-            #######################################
-            ### AFTER CONFIRMATION CALCULATION ###
-            #######################################
-
-            group_df = df.filter((pl.col("after_breakout")) &
-                                 (pl.col("session"))) \
-                .group_by(["date"]).agg([
-                pl.col("low").min().alias("after_conf_min"),
-                pl.col("high").max().alias("after_conf_max"),
-            ])
-
-            orb_df = orb_df.join(
-                group_df[
-                    ["date", "after_conf_min", "after_conf_max"]
-                ],
-                left_on="date", right_on="date", how="left")
-
-            #######################################
-            ###     RETRACEMENT CALCULATIONS    ###
-            #######################################
-            # Retracements do not consider if high or low happend first.
-
-            #get min and max values and times after confirmation (no hirachie)
-            df = df.join(group_df[["date", "after_conf_min", "after_conf_max"]],
-                         left_on="date", right_on="date", how="left")
-
-            df = df.with_columns([
-                (pl.col("low") == pl.col("after_conf_min")).alias("min_price_bool"),
-                (pl.col("high") == pl.col("after_conf_max")).alias("max_price_bool"),
-            ])
-
-            min_values = df.filter(pl.col("min_price_bool")).group_by("date").agg([
-                pl.col("time").first().alias("min_price_time"),
-                #pl.col("low").first().alias("min_price_value"),
-
-            ])
-
-            max_values = df.filter(pl.col("max_price_bool")).group_by("date").agg([
-                pl.col("time").first().alias("max_price_time"),
-                #pl.col("high").first().alias("max_price_value"),
-            ])
-            # join min max time to df as well as upday information?
-
-            min_max_values = min_values.join(
-                max_values,
-                left_on="date", right_on="date", how="left"
-            )
-
-            df = df.join(min_max_values,
-                         left_on="date", right_on="date", how="left")
-
-            df = df.join(orb_df[["date", "upday"]],
-                         left_on="date", right_on="date", how="left")
-
-            # Max Expansion and retracement in conf direction
-
-            df = df.with_columns(
-                (pl.when(pl.col("upday"))
-                 .then((pl.col("time") <= pl.col("max_price_time")).alias("pre_max_expansion"))
-                 .otherwise((pl.col("time") <= pl.col("min_price_time")).alias("pre_max_expansion"))
-                 )
-            )
-
-            # df.head(10000).write_csv(f"{session}_5m_test.csv", separator=";")
-            # orb_df.write_csv(f"{session}_test.csv", separator=";")
-            #group df by after conf and before max expansion
-
-            group_long_df = df.filter(
-                (pl.col("after_breakout")),
-                (pl.col("pre_max_expansion")),
-                (pl.col("upday")),
-            ).group_by(
-                ["date"]
-            ).agg([
-                (pl.col("low").min().alias("max_retracement_value")),
-                (pl.col("high").max().alias("max_expansion_value")),
-            ])
-
-            group_short_df = df.filter(
-                (pl.col("after_breakout")),
-                (pl.col("pre_max_expansion")),
-                (~pl.col("upday")),
-            ).group_by(
-                ["date"]
-            ).agg([
-                (pl.col("high").max().alias("max_retracement_value")),
-                (pl.col("low").min().alias("max_expansion_value")),
-            ])
-
-            group_df = pl.concat([group_short_df, group_long_df])
-
-            orb_df = orb_df.join(group_df,
-                               left_on="date", right_on="date", how="left")
-
-
-            #get min and max times after confirmation and before max
-            df = df.join(group_df,
-                         left_on="date", right_on="date", how="left")
-
-            df = df.with_columns(
-                pl.col("max_retracement_value").fill_null(0).alias("max_retracement_value"),
-                pl.col("max_expansion_value").fill_null(0).alias("max_expansion_value"),
-            )
-
-            df = df.with_columns([
-                (pl.when(pl.col("upday"))
-                    .then(pl.col("low") == pl.col("max_retracement_value"))
-                    .otherwise(pl.col("high") == pl.col("max_retracement_value"))
-                    )
-                    .alias("max_retracement_time_bool"),
-
-                (pl.when(pl.col("upday"))
-                 .then(pl.col("high") == pl.col("max_expansion_value"))
-                 .otherwise(pl.col("low") == pl.col("max_expansion_value"))
-                 )
-                    .alias("max_expansion_time_bool"),
-            ])
-
-            # Retracement
-            group_df_ret = df.filter(
-                (pl.col("after_breakout")),
-                (pl.col("pre_max_expansion")),
-                (pl.col("max_retracement_time_bool")),
-            ).group_by(
-                ["date"]
-            ).agg([
-                (pl.col("time").first().alias("max_retracement_time")),
-            ])
-            # Expansion
-            group_df_exp = df.filter(
-                (pl.col("after_breakout")),
-                (pl.col("pre_max_expansion")),
-                (pl.col("max_expansion_time_bool")),
-            ).group_by(
-                ["date"]
-            ).agg([
-                (pl.col("time").first().alias("max_expansion_time")),
-            ])
-
-            orb_df = orb_df.join(group_df_ret,
-                               left_on="date", right_on="date", how="left")
-            orb_df = orb_df.join(group_df_exp,
-                               left_on="date", right_on="date", how="left")
-
-            #df.head(10000).write_csv(f"{session}_5m_test.csv", separator=";")
-            # orb_df.write_csv(f"{session}_test.csv", separator=";")
-
-
-            orb_df = orb_df.with_columns(
-                pl.when(
-                    (pl.col("upday") & (pl.col("max_retracement_value") < pl.col("range_high"))) |
-                    (~pl.col("upday") & (pl.col("max_retracement_value") > pl.col("range_low")))
+                        .otherwise(False)
                 )
-                    .then(True)
-                    .otherwise(False)
-                    .alias("retrace_into_range")
-            )
-
-            orb_df = orb_df.with_columns(
-                (pl.col("max_expansion_time") - (pl.col("max_expansion_time").dt.minute() % 15) * pl.duration(minutes=1))
-                    .dt.strftime("%H:%M")
-                    .alias("expansion_window_start"),
-                (pl.col("max_expansion_time") - (pl.col("max_expansion_time").dt.minute() % 15) * pl.duration(
-                    minutes=1) + pl.duration(minutes=15))
-                    .dt.strftime("%H:%M")
-                    .alias("expansion_window_end"),
-                (pl.col("max_retracement_time") - (pl.col("max_retracement_time").dt.minute() % 15) * pl.duration(
-                    minutes=1))
-                    .dt.strftime("%H:%M")
-                    .alias("retracement_window_start"),
-                (pl.col("max_retracement_time") - (pl.col("max_retracement_time").dt.minute() % 15) * pl.duration(
-                    minutes=1) + pl.duration(minutes=15))
-                    .dt.strftime("%H:%M")
-                    .alias("retracement_window_end"),
-
+            ).alias("upday"))
+        # ORB True
+        orb_df = orb_df.with_columns(
+            (pl.col("up_confirmation").is_null() | pl.col("down_confirmation").is_null()).alias("range_holds"),
+
+        )
+        # Close OUTSIDE ORB
+        orb_df = orb_df.with_columns(
+            pl.when(pl.col("upday") & (pl.col("session_close") > pl.col("range_high")))
+                .then(True)
+                .when(~pl.col("upday") & (pl.col("session_close") < pl.col("range_low")))
+                .then(True)
+                .otherwise(False)
+                .alias("close_outside_range")
+        )
+
+        ##########################################################
+        ### PRE CONFIRMATION CALCULATION
+        #########################################################
+
+        df = df.join(orb_df[["date", "breakout_time"]], left_on="date", right_on="date")
+
+        df = df.with_columns(
+            (pl.col("time") < pl.col("breakout_time")).alias("before_breakout"),
+            (pl.col("time") > pl.col("breakout_time")).alias("after_breakout")
+        )
+
+        group_df = df.filter((pl.col("before_breakout")) &
+                             (pl.col("session"))) \
+            .group_by(["date"]).agg([
+            pl.col("low").min().alias("pre_conf_min"),
+            pl.col("high").max().alias("pre_conf_max")
+        ])
+
+        orb_df = orb_df.join(group_df[["date", "pre_conf_min", "pre_conf_max"]], left_on="date", right_on="date",
+                           how="left")
+
+
+
+        #######################################
+        ### AFTER CONFIRMATION CALCULATION ###
+        #######################################
+
+        group_df = df.filter((pl.col("after_breakout")) &
+                             (pl.col("session"))) \
+            .group_by(["date"]).agg([
+            pl.col("low").min().alias("after_conf_min"),
+            pl.col("high").max().alias("after_conf_max"),
+        ])
+
+        orb_df = orb_df.join(
+            group_df[
+                ["date", "after_conf_min", "after_conf_max"]
+            ],
+            left_on="date", right_on="date", how="left")
+
+        #######################################
+        ###     RETRACEMENT CALCULATIONS    ###
+        #######################################
+        # Retracements do not consider if high or low happend first.
+
+        #get min and max values and times after confirmation (no hirachie)
+        df = df.join(group_df[["date", "after_conf_min", "after_conf_max"]],
+                     left_on="date", right_on="date", how="left")
+
+        df = df.with_columns([
+            (pl.col("low") == pl.col("after_conf_min")).alias("min_price_bool"),
+            (pl.col("high") == pl.col("after_conf_max")).alias("max_price_bool"),
+        ])
+
+        min_values = df.filter(pl.col("min_price_bool")).group_by("date").agg([
+            pl.col("time").first().alias("min_price_time"),
+            #pl.col("low").first().alias("min_price_value"),
+
+        ])
+
+        max_values = df.filter(pl.col("max_price_bool")).group_by("date").agg([
+            pl.col("time").first().alias("max_price_time"),
+            #pl.col("high").first().alias("max_price_value"),
+        ])
+        # join min max time to df as well as upday information?
+
+        min_max_values = min_values.join(
+            max_values,
+            left_on="date", right_on="date", how="left"
+        )
+
+        df = df.join(min_max_values,
+                     left_on="date", right_on="date", how="left")
+
+        df = df.join(orb_df[["date", "upday"]],
+                     left_on="date", right_on="date", how="left")
+
+        # Max Expansion and retracement in conf direction
+
+        df = df.with_columns(
+            (pl.when(pl.col("upday"))
+             .then((pl.col("time") <= pl.col("max_price_time")).alias("pre_max_expansion"))
+             .otherwise((pl.col("time") <= pl.col("min_price_time")).alias("pre_max_expansion"))
+             )
+        )
+
+        # df.head(10000).write_csv(f"{session}_5m_test.csv", separator=";")
+        # orb_df.write_csv(f"{session}_test.csv", separator=";")
+        #group df by after conf and before max expansion
+
+        group_long_df = df.filter(
+            (pl.col("after_breakout")),
+            (pl.col("pre_max_expansion")),
+            (pl.col("upday")),
+        ).group_by(
+            ["date"]
+        ).agg([
+            (pl.col("low").min().alias("max_retracement_value")),
+            (pl.col("high").max().alias("max_expansion_value")),
+        ])
+
+        group_short_df = df.filter(
+            (pl.col("after_breakout")),
+            (pl.col("pre_max_expansion")),
+            (~pl.col("upday")),
+        ).group_by(
+            ["date"]
+        ).agg([
+            (pl.col("high").max().alias("max_retracement_value")),
+            (pl.col("low").min().alias("max_expansion_value")),
+        ])
+
+        group_df = pl.concat([group_short_df, group_long_df])
+
+        orb_df = orb_df.join(group_df,
+                           left_on="date", right_on="date", how="left")
+
+
+        #get min and max times after confirmation and before max
+        df = df.join(group_df,
+                     left_on="date", right_on="date", how="left")
+
+        df = df.with_columns(
+            pl.col("max_retracement_value").fill_null(0).alias("max_retracement_value"),
+            pl.col("max_expansion_value").fill_null(0).alias("max_expansion_value"),
+        )
+
+        df = df.with_columns([
+            (pl.when(pl.col("upday"))
+                .then(pl.col("low") == pl.col("max_retracement_value"))
+                .otherwise(pl.col("high") == pl.col("max_retracement_value"))
+                )
+                .alias("max_retracement_time_bool"),
+
+            (pl.when(pl.col("upday"))
+             .then(pl.col("high") == pl.col("max_expansion_value"))
+             .otherwise(pl.col("low") == pl.col("max_expansion_value"))
+             )
+                .alias("max_expansion_time_bool"),
+        ])
+
+        # Retracement
+        group_df_ret = df.filter(
+            (pl.col("after_breakout")),
+            (pl.col("pre_max_expansion")),
+            (pl.col("max_retracement_time_bool")),
+        ).group_by(
+            ["date"]
+        ).agg([
+            (pl.col("time").first().alias("max_retracement_time")),
+        ])
+        # Expansion
+        group_df_exp = df.filter(
+            (pl.col("after_breakout")),
+            (pl.col("pre_max_expansion")),
+            (pl.col("max_expansion_time_bool")),
+        ).group_by(
+            ["date"]
+        ).agg([
+            (pl.col("time").first().alias("max_expansion_time")),
+        ])
+
+        orb_df = orb_df.join(group_df_ret,
+                           left_on="date", right_on="date", how="left")
+        orb_df = orb_df.join(group_df_exp,
+                           left_on="date", right_on="date", how="left")
+
+        #df.head(10000).write_csv(f"{session}_5m_test.csv", separator=";")
+        # orb_df.write_csv(f"{session}_test.csv", separator=";")
+
+
+        orb_df = orb_df.with_columns(
+            pl.when(
+                (pl.col("upday") & (pl.col("max_retracement_value") < pl.col("range_high"))) |
+                (~pl.col("upday") & (pl.col("max_retracement_value") > pl.col("range_low")))
             )
-
-            orb_df = orb_df.with_columns(
-                pl.concat_str([
-                    pl.col("expansion_window_start"),
-                    pl.lit(" - "),
-                    pl.col("expansion_window_end")
-                ]).alias("expansion_window"),
-
-                pl.concat_str([
-                    pl.col("retracement_window_start"),
-                    pl.lit(" - "),
-                    pl.col("retracement_window_end")
-                ]).alias("retracement_window"),
+                .then(True)
+                .otherwise(False)
+                .alias("retrace_into_range")
+        )
+
+        orb_df = orb_df.with_columns(
+            time_window("max_expansion_time", start_time, self.window_minutes).alias("expansion_window"),
+            time_window("max_retracement_time", start_time, self.window_minutes).alias("retracement_window"),
+        )
+
+        return orb_df
+
+    def orb_table_single_pass(self, session):
+        # All per day statistics in one pass of segmented NumPy reductions over the 5min bars, which are sorted
+        # once by (date, time). Per day values (range, breakout time, ...) are broadcast back to the bars with
+        # np.repeat instead of being joined back onto the 5min table.
+        df = self.sessions[session]["5_min_session"].sort(["date", "time"])
+        start_time = self.sessions[session]["start_time"]
+
+        bar_time = df["time"].dt.epoch("us").to_numpy().astype(np.float64)
+        open_, high, low, close = [df[col].to_numpy() for col in ["open", "high", "low", "close"]]
+        body_high, body_low = df["body_high"].to_numpy(), df["body_low"].to_numpy()
+        opening_range, in_session = df["opening_range"].to_numpy(), df["session"].to_numpy()
+
+        dates = df["date"].to_physical().to_numpy()
+        # no bars (e.g. no new bars in an incremental run) -> no days, an empty table like the legacy engine
+        starts = np.flatnonzero(np.r_[len(dates) > 0, dates[1:] != dates[:-1]])
+        counts = np.diff(np.r_[starts, len(dates)])
+
+        def per_bar(day_values):
+            return np.repeat(day_values, counts)
+
+        range_high = segment_max(high, opening_range, starts)
+        range_low = segment_min(low, opening_range, starts)
+
+        # ORB confirmation
+        up_confirmation = segment_first(bar_time, in_session & (close > per_bar(range_high)), starts)
+        down_confirmation = segment_first(bar_time, in_session & (close < per_bar(range_low)), starts)
+        breakout_time = np.fmin(up_confirmation, down_confirmation)
+        upday = ~np.isnan(up_confirmation) & (np.isnan(down_confirmation) | (up_confirmation < down_confirmation))
+
+        before_breakout = in_session & (bar_time < per_bar(breakout_time))
+        after_breakout = bar_time > per_bar(breakout_time)
+        after_conf_min = segment_min(low, after_breakout & in_session, starts)
+        after_conf_max = segment_max(high, after_breakout & in_session, starts)
+
+        # Retracements do not consider if high or low happend first.
+        min_price_time = segment_first(bar_time, low == per_bar(after_conf_min), starts)
+        max_price_time = segment_first(bar_time, high == per_bar(after_conf_max), starts)
+        upday_bar = per_bar(upday)
+        pre_max_expansion = np.where(upday_bar,
+                                     bar_time <= per_bar(max_price_time),
+                                     bar_time <= per_bar(min_price_time))
+        expansion_leg = after_breakout & pre_max_expansion
+
+        max_retracement_value = np.where(upday,
+                                         segment_min(low, expansion_leg, starts),
+                                         segment_max(high, expansion_leg, starts))
+        max_expansion_value = np.where(upday,
+                                       segment_max(high, expansion_leg, starts),
+                                       segment_min(low, expansion_leg, starts))
+        max_retracement_bar = np.where(upday_bar,
+                                       low == per_bar(max_retracement_value),
+                                       high == per_bar(max_retracement_value))
+        max_expansion_bar = np.where(upday_bar,
+                                     high == per_bar(max_expansion_value),
+                                     low == per_bar(max_expansion_value))
+
+        orb_df = pl.DataFrame({
+            "date": df["date"].gather(starts),
+            "range_high": range_high,
+            "range_low": range_low,
+            "range_high_body": segment_max(body_high, opening_range, starts),
+            "range_low_body": segment_min(body_low, opening_range, starts),
+            "range_open": segment_first(open_, opening_range, starts),
+            "range_close": segment_last(close, opening_range, starts),
+
+            "session_high": segment_max(high, in_session, starts),
+            "session_low": segment_min(low, in_session, starts),
+            "session_body_high": segment_max(body_high, in_session, starts),
+            "session_body_low": segment_min(body_low, in_session, starts),
+            "session_close": segment_last(close, in_session, starts),
+
+            "up_confirmation": up_confirmation,
+            "down_confirmation": down_confirmation,
+            "breakout_time": breakout_time,
+            "upday": upday,
+
+            "pre_conf_min": segment_min(low, before_breakout, starts),
+            "pre_conf_max": segment_max(high, before_breakout, starts),
+            "after_conf_min": after_conf_min,
+            "after_conf_max": after_conf_max,
+
+            "max_retracement_value": max_retracement_value,
+            "max_expansion_value": max_expansion_value,
+            "max_retracement_time": segment_first(bar_time, expansion_leg & max_retracement_bar, starts),
+            "max_expansion_time": segment_first(bar_time, expansion_leg & max_expansion_bar, starts),
+        }, nan_to_null=True)
+
+        # back from epoch floats to the datetimes of the session time zone
+        orb_df = orb_df.with_columns(
+            pl.col(["up_confirmation", "down_confirmation", "breakout_time", "max_retracement_time",
+                    "max_expansion_time"])
+                .cast(pl.Int64)
+                .cast(pl.Datetime("us"))
+                .dt.replace_time_zone("UTC")
+                .dt.convert_time_zone(df.schema["time"].time_zone)
+        )
+
+        # Days need opening range and session bars, remove days where ORB high == ORB low
+        orb_df = orb_df.filter(
+            pl.col("range_high").is_not_null() &
+            pl.col("session_high").is_not_null() &
+            (pl.col("range_high") != pl.col("range_low"))
+        )
+
+        orb_df = orb_df.with_columns([
+            (pl.col("range_open") < pl.col("range_close")).alias("greenbox"),
+            (pl.col("range_high") - pl.col("range_low")).round(6).alias("range_size"),
+            (pl.col("range_high") < pl.col("session_high")).alias("breached_range_high"),
+            (pl.col("range_low") > pl.col("session_low")).alias("breached_range_low"),
+            (pl.col("range_high") < pl.col("session_body_high")).alias("closed_above_range_high"),
+            (pl.col("range_low") > pl.col("session_body_low")).alias("closed_below_range_low"),
+            (pl.col("up_confirmation").is_null() | pl.col("down_confirmation").is_null()).alias("range_holds"),
+            time_window("breakout_time", start_time, self.window_minutes).alias("breakout_window"),
+            time_window("max_expansion_time", start_time, self.window_minutes).alias("expansion_window"),
+            time_window("max_retracement_time", start_time, self.window_minutes).alias("retracement_window"),
+
+            pl.when(pl.col("upday") & (pl.col("session_close") > pl.col("range_high")))
+                .then(True)
+                .when(~pl.col("upday") & (pl.col("session_close") < pl.col("range_low")))
+                .then(True)
+                .otherwise(False)
+                .alias("close_outside_range"),
+
+            pl.when(
+                (pl.col("upday") & (pl.col("max_retracement_value") < pl.col("range_high"))) |
+                (~pl.col("upday") & (pl.col("max_retracement_value") > pl.col("range_low")))
             )
+                .then(True)
+                .otherwise(False)
+                .alias("retrace_into_range"),
+        ])
+        orb_df = orb_df.with_columns([
+            (pl.col("closed_above_range_high") | pl.col("closed_below_range_low")).alias("range_confirmed"),
+            (pl.col("closed_above_range_high") ^ pl.col("closed_below_range_low")).alias("range_holds_close"),
+            (pl.col("breached_range_low") ^ pl.col("breached_range_high")).alias("range_holds_wick"),
+        ])
+
+        # same column order as the legacy engine
+        return orb_df.select([
+            "date", "range_high", "range_low", "range_high_body", "range_low_body", "range_open", "range_close",
+            "greenbox", "range_size", "session_high", "session_low", "session_body_high", "session_body_low",
+            "session_close", "breached_range_high", "breached_range_low", "closed_above_range_high",
+            "closed_below_range_low", "range_confirmed", "range_holds_close", "range_holds_wick",
+            "up_confirmation", "down_confirmation", "breakout_time", "breakout_window", "upday", "range_holds",
+            "close_outside_range", "pre_conf_min", "pre_conf_max", "after_conf_min", "after_conf_max",
+            "max_retracement_value", "max_expansion_value", "max_retracement_time", "max_expansion_time",
+            "retrace_into_range", "expansion_window", "retracement_window",
+        ])
+
+    def open_price_calculations(self, orb_df, session):
+        orb_df = orb_df.join(self.sessions[session]["open_prices"], left_on="date", right_on="date", how="left")
+
+        # Has NY True Open or Daily open liquidity been taken by the ORB Hour?
+        orb_df = orb_df.with_columns([
+            (((pl.col("range_open") > pl.col("day_open")) &
+             (pl.col("range_low") < pl.col("day_open")) &
+              (pl.col("range_close") > pl.col("day_open")))|
+             ((pl.col("range_open") < pl.col("day_open")) &
+              (pl.col("range_high") > pl.col("day_open")) &
+              (pl.col("range_close") < pl.col("day_open"))
+             )).alias("took_out_day_open"),
+            (((pl.col("range_open") > pl.col("ny_true_open")) &
+              (pl.col("range_low") < pl.col("ny_true_open")) &
+              (pl.col("range_close") > pl.col("ny_true_open"))) |
+             ((pl.col("range_open") < pl.col("ny_true_open")) &
+              (pl.col("range_high") > pl.col("ny_true_open")) &
+              (pl.col("range_close") < pl.col("ny_true_open"))
+              )).alias("took_out_ny_true_open"),
+
+        ])
+
+        return orb_df
+
+    def fib_level_expressions(self):
+        # Level of a price relative to the opening range (0 = range low, 1 = range high), bucketed by level_bucket.
+        decimals = max(0, -Decimal(str(self.level_bucket)).as_tuple().exponent)
+        levels, exact_levels = [], []
+        for name, long_source, short_source, anchor, long_rounding in self.fib_levels:
+            range_low, range_width = range_anchors[anchor]
+            long_level = (pl.col(long_source) - pl.col(range_low)) / pl.col(range_width)
+            short_level = (pl.col(short_source) - pl.col(range_low)) / pl.col(range_width)
+
+            # short days are rounded in the opposite direction
+            if long_rounding == "floor":
+                bucket = pl.when(pl.col("upday")) \
+                    .then((long_level / self.level_bucket).floor()) \
+                    .otherwise((short_level / self.level_bucket).ceil())
+            else:
+                bucket = pl.when(pl.col("upday")) \
+                    .then((long_level / self.level_bucket).ceil()) \
+                    .otherwise((short_level / self.level_bucket).floor())
+            levels.append((bucket * self.level_bucket).round(decimals).alias(name))
 
-            orb_df = orb_df.drop(["retracement_window_start", "retracement_window_end", "expansion_window_start", "expansion_window_end"])
-
-            orb_df = orb_df.join(self.sessions[session]["open_prices"], left_on="date", right_on="date", how="left")
-
-            # Has NY True Open or Daily open liquidity been taken by the ORB Hour?
-            orb_df = orb_df.with_columns([
-                (((pl.col("range_open") > pl.col("day_open")) &
-                 (pl.col("range_low") < pl.col("day_open")) &
-                  (pl.col("range_close") > pl.col("day_open")))|
-                 ((pl.col("range_open") < pl.col("day_open")) &
-                  (pl.col("range_high") > pl.col("day_open")) &
-                  (pl.col("range_close") < pl.col("day_open"))
-                 )).alias("took_out_day_open"),
-                (((pl.col("range_open") > pl.col("ny_true_open")) &
-                  (pl.col("range_low") < pl.col("ny_true_open")) &
-                  (pl.col("range_close") > pl.col("ny_true_open"))) |
-                 ((pl.col("range_open") < pl.col("ny_true_open")) &
-                  (pl.col("range_high") > pl.col("ny_true_open")) &
-                  (pl.col("range_close") < pl.col("ny_true_open"))
-                  )).alias("took_out_ny_true_open"),
-
-            ])
+            if self.exact_levels:
+                exact_levels.append(
+                    pl.when(pl.col("upday")).then(long_level).otherwise(short_level).alias(f"{name}_exact"))
 
-            self.sessions[session]["orb_table"] = orb_df
+        return levels + exact_levels
 
     def fib_level_calculations(self):
 
         for session in self.sessions:
             df = self.sessions[session]["orb_table"]
 
-            # Expansion_level Calculation
+            # range denominators are calculated once for all levels
             df = df.with_columns(
-                pl.when(pl.col("upday"))
-                    .then(
-                        (((pl.col("max_expansion_value") - pl.col("range_low")) /
-                        (pl.col("range_high") - pl.col("range_low")) / 0.1)
-                            .floor() * 0.1).round(1))
-                    .otherwise(
-                        (((pl.col("max_expansion_value") - pl.col("range_low")) /
-                        (pl.col("range_high") - pl.col("range_low"))/0.1)
-                            .ceil() * 0.1).round(1))
-                    .alias("expansion_level"),
-
-                # Expansion_level_body Calculation
-                pl.when(pl.col("upday"))
-                    .then(
-                    (((pl.col("max_expansion_value") - pl.col("range_low_body")) /
-                      (pl.col("range_high_body") - pl.col("range_low_body")) / 0.1)
-                     .floor() * 0.1).round(1))
-                    .otherwise(
-                    (((pl.col("max_expansion_value") - pl.col("range_low_body")) /
-                      (pl.col("range_high_body") - pl.col("range_low_body")) / 0.1)
-                     .ceil() * 0.1).round(1))
-                    .alias("expansion_level_body"),
-
-                # Retracement_level Calculation
-                pl.when(pl.col("upday"))
-                    .then(
-                        (((pl.col("max_retracement_value") - pl.col("range_low")) /
-                        (pl.col("range_high") - pl.col("range_low"))/0.1)
-                            .ceil() * 0.1).round(1))
-                    .otherwise(
-                        (((pl.col("max_retracement_value") - pl.col("range_low")) /
-                        (pl.col("range_high") - pl.col("range_low"))/0.1)
-                            .floor()*0.1).round(1))
-                    .alias("retracement_level"),
-
-                # Retracement_level Calculation
-                pl.when(pl.col("upday"))
-                    .then(
-                    (((pl.col("max_retracement_value") - pl.col("range_low_body")) /
-                      (pl.col("range_high_body") - pl.col("range_low_body")) / 0.1)
-                     .ceil() * 0.1).round(1))
-                    .otherwise(
-                    (((pl.col("max_retracement_value") - pl.col("range_low_body")) /
-                      (pl.col("range_high_body") - pl.col("range_low_body")) / 0.1)
-                     .floor() * 0.1).round(1))
-                    .alias("retracement_level_body"),
-
-                # After con min, max level calc
-                pl.when(pl.col("upday"))
-                    .then(
-                    (((pl.col("after_conf_max") - pl.col("range_low")) /
-                      (pl.col("range_high") - pl.col("range_low")) / 0.1)
-                     .ceil() * 0.1).round(1))
-                    .otherwise(
-                    (((pl.col("after_conf_min") - pl.col("range_low")) /
-                      (pl.col("range_high") - pl.col("range_low")) / 0.1)
-                     .floor() * 0.1).round(1))
-                    .alias("after_conf_max_level"),
-
-                # After con min, max level calc
-                pl.when(pl.col("upday"))
-                    .then(
-                    (((pl.col("after_conf_min") - pl.col("range_low")) /
-                      (pl.col("range_high") - pl.col("range_low")) / 0.1)
-                     .ceil() * 0.1).round(1))
-                    .otherwise(
-                    (((pl.col("after_conf_max") - pl.col("range_low")) /
-                      (pl.col("range_high") - pl.col("range_low")) / 0.1)
-                     .floor() * 0.1).round(1))
-                    .alias("after_conf_min_level"),
-
-                # ORB Open Level
-                pl.when(pl.col("upday"))
-                    .then(
-                    (((pl.col("range_open") - pl.col("range_low")) /
-                      (pl.col("range_high") - pl.col("range_low")) / 0.1)
-                     .ceil() * 0.1).round(1))
-                    .otherwise(
-                    (((pl.col("range_open") - pl.col("range_low")) /
-                      (pl.col("range_high") - pl.col("range_low")) / 0.1)
-                     .floor() * 0.1).round(1))
-                    .alias("opening_level"),
-
-                # ORB Close Level
-                pl.when(pl.col("upday"))
-                    .then(
-                    (((pl.col("range_close") - pl.col("range_low")) /
-                      (pl.col("range_high") - pl.col("range_low")) / 0.1)
-                     .ceil() * 0.1).round(1))
-                    .otherwise(
-                    (((pl.col("range_close") - pl.col("range_low")) /
-                      (pl.col("range_high") - pl.col("range_low")) / 0.1)
-                     .floor() * 0.1).round(1))
-                    .alias("closing_level"),
-
-                # Session Close Level
-                pl.when(pl.col("upday"))
-                    .then(
-                    (((pl.col("session_close") - pl.col("range_low")) /
-                      (pl.col("range_high") - pl.col("range_low")) / 0.1)
-                     .ceil() * 0.1).round(1))
-                    .otherwise(
-                    (((pl.col("session_close") - pl.col("range_low")) /
-                      (pl.col("range_high") - pl.col("range_low")) / 0.1)
-                     .floor() * 0.1).round(1))
-                    .alias("session_close_level"),
-
-                # Session low Level
-                pl.when(pl.col("upday"))
-                    .then(
-                    (((pl.col("session_low") - pl.col("range_low")) /
-                      (pl.col("range_high") - pl.col("range_low")) / 0.1)
-                     .ceil() * 0.1).round(1))
-                    .otherwise(
-                    (((pl.col("session_low") - pl.col("range_low")) /
-                      (pl.col("range_high") - pl.col("range_low")) / 0.1)
-                     .floor() * 0.1).round(1))
-                    .alias("session_low_level"),
-
-                # Session low Level
-                pl.when(pl.col("upday"))
-                    .then(
-                    (((pl.col("session_high") - pl.col("range_low")) /
-                      (pl.col("range_high") - pl.col("range_low")) / 0.1)
-                     .ceil() * 0.1).round(1))
-                    .otherwise(
-                    (((pl.col("session_high") - pl.col("range_low")) /
-                      (pl.col("range_high") - pl.col("range_low")) / 0.1)
-                     .floor() * 0.1).round(1))
-                    .alias("session_high_level"),
+                (pl.col("range_high") - pl.col("range_low")).alias("range_width"),
+                (pl.col("range_high_body") - pl.col("range_low_body")).alias("range_width_body"),
             )
+            df = df.with_columns(self.fib_level_expressions()).drop(["range_width", "range_width_body"])
 
             df = df.sort("date")
             self.sessions[session]["orb_table"] = df
@@ -716,36 +1074,7 @@ class OpeningRange:
                 (((pl.col("range_high_prev") - pl.col("range_low_prev")) / 2) + pl.col("range_low_prev")).alias("midline_prev_session"),
             )
 
-            mdl = mdl.with_columns(
-                pl.when((pl.col("range_low") <= pl.col("midline_prev_session")) &
-                     (pl.col("range_low") >= pl.col("range_low_prev")) &
-                     (pl.col("range_high") > pl.col("range_high_prev")))
-                    .then(pl.lit("Weak Uptrend"))
-                    .when((pl.col("range_low") > pl.col("midline_prev_session")) &
-                          (pl.col("range_low") <= pl.col("range_high_prev")) &
-                          (pl.col("range_high") > pl.col("range_high_prev")))
-                    .then(pl.lit("Medium Uptrend"))
-                    .when(pl.col("range_low") > pl.col("range_high_prev"))
-                    .then(pl.lit("Strong Uptrend"))
-                    .when((pl.col("range_high") >= pl.col("midline_prev_session")) &
-                          (pl.col("range_high") <= pl.col("range_high_prev")) &
-                          (pl.col("range_low") < pl.col("range_low_prev")))
-                    .then(pl.lit("Weak Downtrend"))
-                    .when((pl.col("range_high") < pl.col("midline_prev_session")) &
-                          (pl.col("range_high") >= pl.col("range_low_prev")) &
-                          (pl.col("range_low") < pl.col("range_low_prev")))
-                    .then(pl.lit("Medium Downtrend"))
-                    .when(pl.col("range_high") < pl.col("range_low_prev"))
-                    .then(pl.lit("Strong Downtrend"))
-                    .when((pl.col("range_high") < pl.col("range_high_prev")) &
-                          (pl.col("range_low") > pl.col("range_low_prev")))
-                    .then(pl.lit("Contraction"))
-                    .when((pl.col("range_high") > pl.col("range_high_prev")) &
-                          (pl.col("range_low") < pl.col("range_low_prev")))
-                    .then(pl.lit("Expansion"))
-                    .otherwise(pl.lit("None"))
-                    .alias("model")
-            )
+            mdl = mdl.with_columns(session_model())
 
 
             df = df.join(mdl["date", "model",], left_on="date", right_on="date", suffix="_prev", how="left")
@@ -766,12 +1095,89 @@ class OpeningRange:
             )
             self.sessions[session]["orb_table"] = df
 
-#Calculate ALL Symbols
-for symbol in symbols:
-   start = t.time()
-   ORB = OpeningRange(symbol, orb_duration=30)
-   ORB.export_all_orb_tables(unix=True)
-   print(f"{symbol} took: {round(t.time() - start, 2)} seconds")
+def build_symbol(symbol, durations, start_times_list, incremental=False, unix=True, file_format="csv"):
+    # Builds and exports all (duration x start times) jobs of one symbol. The bars are loaded once and shared
+    # by the jobs. Incremental jobs read only their own tail of the bar store, which is cheaper than sharing.
+    data = None
+    load_seconds = 0
+    if not incremental:
+        start = t.perf_counter()
+        data = load_bars(symbol)
+        load_seconds = t.perf_counter() - start
+
+    timings = []
+    for orb_duration in durations:
+        for start_times in start_times_list:
+            start = t.perf_counter()
+            ORB = OpeningRange(symbol, orb_duration=orb_duration, start_times=start_times,
+                               incremental=incremental, data=data)
+            ORB.export_all_orb_tables(unix=unix, file_format=file_format)
+            ORB.export_session_cube()
+            timings.append({"symbol": symbol,
+                            "orb_duration": orb_duration,
+                            "start_times": start_times,
+                            "seconds": t.perf_counter() - start,
+                            "bars": ORB.data.height})
+    return load_seconds, timings
+
+
+def parse_start_times(value):
+    # "09:30,03:00,08:30" -> start times of the ny, ldn and asia session
+    start_times = [datetime.strptime(start, "%H:%M").time() for start in value.split(",")]
+    if len(start_times) != 3:
+        raise argparse.ArgumentTypeError("Expected three start times (ny,ldn,asia), e.g. 09:30,03:00,08:30")
+    return start_times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and export the ORB tables of several symbols in parallel")
+    parser.add_argument("--symbols", nargs="+", default=symbols, choices=list(symbol_dict))
+    parser.add_argument("--durations", nargs="+", type=int, default=[30, 60], help="Opening range durations in minutes")
+    parser.add_argument("--start-times", type=parse_start_times, action="append",
+                        help="Opening range start times ny,ldn,asia (can be repeated), default 09:30,03:00,08:30")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--incremental", action="store_true", help="Only process days after the last export")
+    parser.add_argument("--format", default="csv", choices=["csv", "xlsx"] + typed_formats)
+    parser.add_argument("--import-bars", action="store_true",
+                        help="Import the raw CSV folders into the parquet bar store and exit")
+    args = parser.parse_args()
+
+    start = t.perf_counter()
+    if args.import_bars:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            for future in as_completed([pool.submit(import_bars_to_store, symbol) for symbol in args.symbols]):
+                future.result()
+        print(f"Imported {len(args.symbols)} symbols in {t.perf_counter() - start:.2f} seconds")
+        return
+
+    start_times_list = args.start_times or [default_start_times]
+    jobs, bars = 0, 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(build_symbol, symbol, args.durations, start_times_list, args.incremental,
+                               True, args.format)
+                   for symbol in args.symbols]
+        for future in as_completed(futures):
+            load_seconds, timings = future.result()
+            if load_seconds:
+                print(f"{timings[0]['symbol']:>7} bars loaded in {load_seconds:7.2f} seconds")
+            for timing in timings:
+                start_times = ",".join(start.strftime("%H:%M") for start in timing["start_times"])
+                print(f"{timing['symbol']:>7} {timing['orb_duration']:>3} min [{start_times}] "
+                      f"took {timing['seconds']:7.2f} seconds ({timing['bars']} bars)")
+                jobs += 1
+                bars += timing["bars"]
+
+    seconds = t.perf_counter() - start
+    print(f"{jobs} jobs in {seconds:.2f} seconds: {jobs / seconds:.2f} jobs/s, {bars / seconds:,.0f} bars/s")
+
+
+if __name__ == "__main__":
+    main()
+
+
+#Import raw CSV folders into the parquet bar store
+# for symbol in symbols:
+#     import_bars_to_store(symbol)
 
 
 #Calculate Single Symbols
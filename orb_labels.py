@@ -0,0 +1,38 @@
+from datetime import time
+
+# Label tables shared by the ORB calculations (orb_calculations.py) and the dashboard (streamlit_app.py)
+
+# Opening range start of each session in the session time zone (asia in Tokyo time)
+session_start_times = {"ny": time(9, 30), "ldn": time(3, 00), "asia": time(8, 30)}
+
+# breakout/expansion/retracement windows are stored as the minutes since the session start of the window start
+no_window = -1
+window_columns = ["breakout_window", "expansion_window", "retracement_window"]
+
+# Session models, the position is the model code
+model_labels = ("None", "Weak Uptrend", "Medium Uptrend", "Strong Uptrend", "Expansion", "Contraction",
+                "Weak Downtrend", "Medium Downtrend", "Strong Downtrend")
+model_codes = {label: code for code, label in enumerate(model_labels)}
+
+
+def window_label(bucket, session_start, minutes=15):
+    # bucket id -> "HH:MM - HH:MM"
+    if bucket == no_window:
+        return "No Breakout"
+    start = session_start.hour * 60 + session_start.minute + int(bucket)
+    end = start + minutes
+    return f"{start // 60 % 24:02d}:{start % 60:02d} - {end // 60 % 24:02d}:{end % 60:02d}"
+
+
+def window_bucket(label, session_start):
+    # "HH:MM - HH:MM" (ORB tables exported before the integer windows) -> bucket id
+    hour, minute = label[:5].split(":")
+    return (int(hour) * 60 + int(minute) - session_start.hour * 60 - session_start.minute) % (24 * 60)
+
+
+def time_of_day_label(seconds):
+    # seconds since midnight -> "HH:MM:SS"
+    if seconds != seconds:  # NaN, no time in the selection
+        return "-"
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
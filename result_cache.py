@@ -0,0 +1,52 @@
+import sys
+import threading
+from collections import OrderedDict
+
+# LRU cache for results derived from the filtered ORB table (plot tables, histograms, statistics).
+# The least recently used entries are evicted once max_entries or max_bytes is exceeded.
+
+
+def result_size(result):
+    if hasattr(result, "memory_usage"):  # pandas objects
+        usage = result.memory_usage(deep=True)
+        return int(usage.sum()) if hasattr(usage, "sum") else int(usage)
+    if hasattr(result, "nbytes"):  # numpy arrays
+        return int(result.nbytes)
+    if isinstance(result, dict):
+        return sys.getsizeof(result) + sum(result_size(value) for value in result.values())
+    return sys.getsizeof(result)
+
+
+class ResultCache:
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 ** 2):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (result, size in bytes)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()  # shared by the sessions of the streamlit server
+
+    def get(self, key, compute):
+        # Cached results are shared, callers must not modify them
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+
+        result = compute()
+        size = result_size(result)
+
+        with self.lock:
+            self.misses += 1
+            if size > self.max_bytes:
+                return result
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+            self.entries[key] = (result, size)
+            self.size += size
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+        return result
@@ -0,0 +1,65 @@
+import numpy as np
+
+# Risk metrics of a sequence of trade results in R (risk multiples), ordered by date. Every function works
+# along the last axis, so r can be the trades of one backtest (1D) or of many backtests/samples (2D rows).
+
+
+def drawdown(r):
+    # distance of the cumulative R from its high (the curve starts at 0)
+    equity = np.cumsum(r, axis=-1)
+    return np.maximum.accumulate(np.maximum(equity, 0), axis=-1) - equity
+
+
+def max_drawdown(r):
+    return drawdown(r).max(axis=-1, initial=0)
+
+
+def longest_run(mask):
+    # longest number of consecutive True values
+    position = np.broadcast_to(np.arange(mask.shape[-1]), mask.shape)
+    run_start = np.maximum.accumulate(np.where(mask, -1, position), axis=-1)
+    return (position - run_start).max(axis=-1, initial=0)
+
+
+def max_drawdown_duration(r):
+    # longest number of trades below the previous high
+    return longest_run(drawdown(r) > 1e-9)
+
+
+def r_ratio(r):
+    # mean R per trade / standard deviation of R (Sharpe ratio like), NaN without a spread of the results.
+    # Equal results like 1/0.3 R are not exact floats, their std is rounding noise and treated as 0.
+    trades = r.shape[-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = r.sum(axis=-1) / trades
+        std = np.sqrt(((r - mean[..., None]) ** 2).sum(axis=-1) / (trades - 1))
+        return np.where(std > 1e-9 * np.abs(mean), mean / std, np.nan)[()]
+
+
+def rolling_win_rate(r, window=20):
+    # win rate of the last window trades (NaN for the first window - 1 trades)
+    wins = np.cumsum(r > 0, axis=-1)
+    rolling = np.full(r.shape, np.nan)
+    rolling[..., window - 1:] = wins[..., window - 1:] / window
+    rolling[..., window:] -= wins[..., :-window] / window
+    return rolling
+
+
+def grouped_expectancy(r, groups, n_groups):
+    # mean R and number of trades of each group (e.g. weekday 0-4, month 1-12) of a 1D trade sequence
+    trades = np.bincount(groups, minlength=n_groups)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.bincount(groups, weights=r, minlength=n_groups) / trades, trades
+
+
+summary_metrics = ["max_drawdown", "max_drawdown_duration", "longest_win_streak", "longest_loss_streak", "r_ratio"]
+
+
+def risk_summary(r):
+    return {
+        "max_drawdown": max_drawdown(r),
+        "max_drawdown_duration": max_drawdown_duration(r),
+        "longest_win_streak": longest_run(r > 0),
+        "longest_loss_streak": longest_run(r < 0),
+        "r_ratio": r_ratio(r),
+    }
@@ -0,0 +1,117 @@
+import argparse
+import glob
+import os
+import re
+import numpy as np
+import pandas as pd
+from orb_labels import model_labels, model_codes
+from cross_symbol import read_orb_columns
+
+# Number of days of every state combination along the asia -> ldn -> ny chain of one symbol and opening range
+# duration. Each session (leg) has the axes model, upday, range_holds and greenbox, so the cube has 12 axes.
+# Sessions without an ORB table row on a day get the missing model code.
+
+cube_legs = ["asia", "ldn", "ny"]
+prev_legs = {"ldn": "asia", "ny": "ldn"}
+cube_attributes = ["model", "upday", "range_holds", "greenbox"]
+missing_model = len(model_labels)
+attribute_sizes = {"model": len(model_labels) + 1, "upday": 2, "range_holds": 2, "greenbox": 2}
+cube_shape = tuple(attribute_sizes[attribute] for _ in cube_legs for attribute in cube_attributes)
+cube_file = "{symbol}_session_cube_{orb_duration}.npz"
+
+
+def to_model_codes(models):
+    # model codes (or labels of older tables) -> codes, missing models are the "None" model
+    models = pd.Series(models)
+    if pd.api.types.is_numeric_dtype(models.dtype):
+        return models.fillna(0).to_numpy(dtype=np.int64)
+    codes = models.astype(object).map(model_codes)
+    return codes.fillna(0).to_numpy(dtype=np.int64)
+
+
+def build_session_cube(tables):
+    # tables: session -> ORB table (model, upday, range_holds, greenbox) indexed by date
+    dates = pd.DatetimeIndex(sorted(set().union(*[pd.DatetimeIndex(table.index) for table in tables.values()])))
+    indices = []
+    for leg in cube_legs:
+        leg_index = {"model": np.full(len(dates), missing_model), "upday": np.zeros(len(dates), dtype=np.int64),
+                     "range_holds": np.zeros(len(dates), dtype=np.int64),
+                     "greenbox": np.zeros(len(dates), dtype=np.int64)}
+        if leg in tables:
+            table = tables[leg]
+            rows = dates.get_indexer(pd.DatetimeIndex(table.index))
+            leg_index["model"][rows] = to_model_codes(table["model"])
+            for attribute in cube_attributes[1:]:
+                leg_index[attribute][rows] = table[attribute].eq(True).to_numpy()
+        indices += [leg_index[attribute] for attribute in cube_attributes]
+
+    counts = np.bincount(np.ravel_multi_index(indices, cube_shape), minlength=np.prod(cube_shape))
+    assert counts.max(initial=0) <= np.iinfo(np.uint16).max
+    return SessionCube(counts.reshape(cube_shape).astype(np.uint16))
+
+
+def load_session_cube(symbol, orb_duration, folder="data"):
+    path = os.path.join(folder, cube_file.format(symbol=symbol, orb_duration=orb_duration))
+    if not os.path.isfile(path):
+        return None
+    with np.load(path) as cube:
+        return SessionCube(cube["counts"])
+
+
+class SessionCube:
+    def __init__(self, counts):
+        self.counts = counts
+
+    @staticmethod
+    def axis(leg, attribute):
+        return cube_legs.index(leg) * len(cube_attributes) + cube_attributes.index(attribute)
+
+    def query(self, conditions, by=()):
+        # conditions: {(leg, attribute): value or list of values}, by: (leg, attribute) axes of the result.
+        # Returns the number of days of each by combination (summed over all other axes).
+        counts = self.counts
+        for (leg, attribute), values in conditions.items():
+            counts = np.take(counts, np.atleast_1d(values).astype(np.int64), axis=self.axis(leg, attribute))
+        by_axes = [self.axis(leg, attribute) for leg, attribute in by]
+        other_axes = tuple(axis for axis in range(counts.ndim) if axis not in by_axes)
+        counts = counts.sum(axis=other_axes, dtype=np.int64)
+        # summed counts keep the by axes in cube order
+        return np.transpose(counts, np.argsort(np.argsort(by_axes)))
+
+    def probabilities(self, conditions, by=()):
+        counts = self.query(conditions, by)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return counts / counts.sum()
+
+    def save(self, path):
+        np.savez_compressed(path, counts=self.counts)
+
+
+def build_cube_from_tables(symbol, orb_duration, folder="data"):
+    tables = {}
+    for leg in cube_legs:
+        file_name = os.path.join(folder, f"{symbol}_{leg}_{orb_duration}")
+        if any(os.path.isfile(f"{file_name}.{file_format}") for file_format in ["parquet", "feather", "csv"]):
+            tables[leg] = read_orb_columns(file_name, cube_attributes)
+    return build_session_cube(tables)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Builds the session cubes of the exported ORB tables")
+    parser.add_argument("--folder", default="data")
+    args = parser.parse_args()
+
+    # {symbol}_{session}_{duration} tables of the default start times
+    jobs = set()
+    for path in glob.glob(os.path.join(args.folder, "*_*_*.*")):
+        match = re.fullmatch(r"(\w+?)_(asia|ldn|ny)_(\d+)\.(csv|parquet|feather)", os.path.basename(path))
+        if match:
+            jobs.add((match.group(1), int(match.group(3))))
+    for symbol, orb_duration in sorted(jobs):
+        path = os.path.join(args.folder, cube_file.format(symbol=symbol, orb_duration=orb_duration))
+        build_cube_from_tables(symbol, orb_duration, args.folder).save(path)
+        print(f"{path}: {os.path.getsize(path)} bytes")
+
+
+if __name__ == "__main__":
+    main()
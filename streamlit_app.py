@@ -1,18 +1,33 @@
 import streamlit as st
-from datetime import datetime, time
 import os
+import threading
 import pandas as pd
 import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-import pickle
+import pyarrow.parquet as pq
+import pyarrow.feather as feather
+from orb_labels import session_start_times, window_columns, window_label, window_bucket, no_window, time_of_day_label, \
+    model_labels, model_codes
+from time_stats import time_statistics, quantiles
+from filter_index import FilterIndex
+from result_cache import ResultCache
+from ml_registry import ModelRegistry, ml_sessions
+from backtest import level_sweep, level_outcomes, trade_kpis, equity_curve, block_bootstrap, bootstrap_intervals, \
+    sweep_risk
+from risk_metrics import risk_summary, rolling_win_rate, grouped_expectancy
+from cross_symbol import load_panel, level_fields, long_side, short_side
+from session_cube import load_session_cube, prev_legs, missing_model
 
 st.set_page_config(page_title="Opening Range Breakout Analytics", layout="wide")
 
 bar_color = "#223459"
 line_color = "#FF4B4B"
 
+# Load the ML lookup grids (models without a grid) in a background thread when the server starts
+warm_up_ml_models = True
+
 if 'retracement_button' not in st.session_state:
     st.session_state['retracement_button'] = False
 
@@ -28,57 +43,84 @@ if 'breakout_button' not in st.session_state:
 if 'use_orb_body' not in st.session_state:
     st.session_state['use_orb_body'] = False
 
-@st.cache_data
-def load_data(file_path):
-    df = pd.read_csv(file_path, sep=";", index_col=0, parse_dates=True)
-    #date_cols = ["up_confirmation", "down_confirmation", "breakout_time", "max_retracement_time", "max_expansion_time"]
-    date_cols = ["breakout_time", "max_retracement_time", "max_expansion_time"]
-    df[date_cols] = df[date_cols].apply(pd.to_datetime, unit="us", utc=True)
-    df[date_cols] = df[date_cols].apply(lambda x: x.dt.tz_convert('America/New_York'))
-    df[date_cols] = df[date_cols].apply(lambda x: x.dt.time)
+time_cols = ["breakout_time", "max_retracement_time", "max_expansion_time"]
+
 
+def read_orb_table(file_name):
+    # Parquet/feather exports are typed (timestamps, bools, model codes), csv needs to be parsed
+    if os.path.isfile(f"{file_name}.parquet"):
+        return pq.read_table(f"{file_name}.parquet").to_pandas(date_as_object=False).set_index("date")
+    if os.path.isfile(f"{file_name}.feather"):
+        return feather.read_table(f"{file_name}.feather").to_pandas(date_as_object=False).set_index("date")
+
+    df = pd.read_csv(f"{file_name}.csv", sep=";", index_col=0, parse_dates=True)
+    # Exports without the time of day columns need the unix timestamps
+    date_cols = [col for col in time_cols if f"{col}_tod" not in df.columns]
+    if date_cols:
+        df[date_cols] = df[date_cols].apply(pd.to_datetime, unit="us", utc=True)
     return df
 
 
-def median_time_calcualtion(time_array):
-    def parse_to_time(value):
-        if pd.isna(value):
-            return None
-        if isinstance(value, time):
-            return value
+@st.cache_data
+def load_data(file_name, session_start):
+    df = read_orb_table(file_name)
+    # Times are seconds since midnight (NY time) and only formatted for display
+    for col in time_cols:
+        if f"{col}_tod" in df.columns:
+            df[col] = df.pop(f"{col}_tod").astype(float)
         else:
-            try:
-                return datetime.strptime(value, "%H:%M:%S").time()
-            except ValueError:
-                raise ValueError("Ungültiges Format. Erwartet wird ein String im Format 'Stunde:Minute:Sekunde'.")
+            ny_time = df[col].dt.tz_convert("America/New_York")
+            df[col] = ny_time.dt.hour * 3600 + ny_time.dt.minute * 60 + ny_time.dt.second
+
+    # Minutes from the breakout to the max retracement/expansion are not part of the builder exports.
+    # The time of day wraps around midnight in the asia session.
+    for col, time_col in [("retracement_in_minutes", "max_retracement_time"),
+                          ("expansion_in_minutes", "max_expansion_time")]:
+        if col not in df.columns:
+            df[col] = (df[time_col] - df["breakout_time"]) % (24 * 3600) / 60
+
+    # Models are int8 codes of orb_labels.model_labels, missing models are the "None" model (code 0).
+    # Older exports contain the model names ("None" is missing in read_csv).
+    for col in ["model", "model_prev"]:
+        if not pd.api.types.is_numeric_dtype(df[col].dtype):
+            df[col] = df[col].astype(object).map(model_codes)
+        df[col] = df[col].fillna(0).astype(np.int8)
+
+    # Time windows are integer bucket ids (minutes since session start).
+    # Older exports contain "HH:MM - HH:MM" labels which are converted once here.
+    for col in window_columns:
+        if df[col].dtype == object:
+            df[col] = df[col].map({label: window_bucket(label, session_start) for label in df[col].dropna().unique()})
+        df[col] = df[col].astype("Int16")
+    df["breakout_window"] = df["breakout_window"].fillna(no_window)
 
-    def time_to_seconds(time_obj):
-
-        return time_obj.hour * 3600 + time_obj.minute * 60 + time_obj.second
+    return df
 
-    def seconds_to_time(seconds):
-        return time(seconds // 3600, (seconds % 3600) // 60, seconds % 60)
 
-    # Parsen zu datetime.time
-    parsed_times = [parse_to_time(value) for value in time_array]
+@st.cache_resource
+def load_filter_table(file_name, session_start, window_minutes):
+    # Table with the window ids of the selected window size and its filter index, shared by all reruns
+    df = load_data(file_name, session_start)
 
-    valid_times = [time_obj for time_obj in parsed_times if not pd.isna(time_obj)]
+    # coarser windows are derived from the 15 minute bucket ids
+    for col in window_columns:
+        df[col] = df[col].where(df[col] == no_window, df[col] // window_minutes * window_minutes)
+    return df, FilterIndex(df)
 
-    # Konvertieren zu Sekunden
-    seconds_list = [time_to_seconds(time_obj) for time_obj in valid_times]
 
-    # Median berechnen
-    median_seconds = sorted(seconds_list)[len(seconds_list) // 2]
+def format_window(bucket):
+    # Labels of the window bucket ids are only created for display
+    return window_label(bucket, session_start, window_minutes)
 
-    # Zurückkonvertieren zu datetime.time
-    median_time = seconds_to_time(median_seconds)
 
-    return median_time
+def time_quantiles_help(stats):
+    quantile_labels = [f"{name}: {time_of_day_label(stats[name])}" for name in quantiles]
+    return " | ".join(quantile_labels + [f"mean: {time_of_day_label(stats['mean'])}"])
 
 
-def create_plot_df(df, groupby_column, inverse_percentile=False, ascending=True):
-    plot_df = df.groupby(groupby_column).agg({"breakout_window": "count"})
-    plot_df = plot_df.rename(columns={"breakout_window": "count"})
+def create_plot_df(df, groupby_column, inverse_percentile=False, ascending=True, count_column="breakout_window"):
+    plot_df = df.groupby(groupby_column).agg({count_column: "count"})
+    plot_df = plot_df.rename(columns={count_column: "count"})
     plot_df["pct"] = plot_df["count"] / plot_df["count"].sum()
     plot_df["percentile"] = plot_df["pct"].cumsum()
 
@@ -90,6 +132,53 @@ def create_plot_df(df, groupby_column, inverse_percentile=False, ascending=True)
     return plot_df
 
 
+@st.cache_resource
+def get_result_cache():
+    # Aggregations of the filtered data shared by all reruns and sessions
+    return ResultCache(max_entries=512, max_bytes=64 * 1024 ** 2)
+
+
+def cached_result(name, compute, *args):
+    # Results only depend on the dataset, the filter combination and the arguments
+    return result_cache.get((dataset_id, filter_signature, name) + args, compute)
+
+
+def run_with_progress(compute, text):
+    # compute(progress) runs in a background thread, progress(done, total) moves the progress bar
+    state = {"done": 0, "total": 1}
+    result = {}
+
+    def run():
+        try:
+            result["value"] = compute(lambda done, total: state.update(done=done, total=total))
+        except Exception as error:
+            result["error"] = error
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    progress_bar = st.progress(0.0, text=text)
+    while thread.is_alive():
+        thread.join(0.1)
+        progress_bar.progress(min(state["done"] / state["total"], 1.0), text=text)
+    progress_bar.empty()
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+
+def cached_plot_df(groupby_column, inverse_percentile=False, ascending=True, count_column="breakout_window"):
+    return cached_result("plot_df",
+                         lambda: create_plot_df(df, groupby_column, inverse_percentile, ascending, count_column),
+                         groupby_column, inverse_percentile, ascending, count_column)
+
+
+def create_overtake_df():
+    df_ret = create_plot_df(df, "retracement_window", count_column="max_expansion_time")
+    df_exp = create_plot_df(df, "expansion_window", count_column="max_retracement_time")
+    df_ret = df_ret[["pct"]].join(df_exp[["pct"]], lsuffix=" retracement", rsuffix=" expansion")
+    return df_ret.fillna(0).rename(index=format_window)
+
+
 def create_plotly_plot(df, title, x_title, y1_name="Pct", y2_name="Overall likelihood", y1="pct", y2="percentile",
                        line_color="red", reversed_x_axis=False):
     subfig = make_subplots(specs=[[{"secondary_y": True}]])
@@ -115,43 +204,50 @@ def create_plotly_plot(df, title, x_title, y1_name="Pct", y2_name="Overall likel
     return subfig
 
 
-def create_join_table(first_symbol, second_symbol):
-    cols_to_use = ["date", "greenbox", "breakout_time", "upday", "max_retracement_time", "max_expansion_time",
-                   "retracement_level", "expansion_level", "closing_level"]
+def create_sweep_heatmap(values, levels, title, color_scale, midpoint=None):
+    # values [stop_loss, take_profit] of one buy in level
+    fig = px.imshow(values, x=levels, y=levels, origin="lower", aspect="auto", title=title,
+                    color_continuous_scale=color_scale, color_continuous_midpoint=midpoint,
+                    labels={"x": "Take Profit Level", "y": "Stop Loss Level", "color": title})
+    fig.update_layout(height=500)
+    return fig
 
-    first_symbol = first_symbol.lower()
-    second_symbol = second_symbol.lower()
 
-    file1 = os.path.join("data", f"{first_symbol}_{session.lower()}.csv")
-    file2 = os.path.join("data", f"{second_symbol}_{session.lower()}.csv")
+@st.cache_resource
+def load_symbol_panel(session_name, orb_duration):
+    # ORB tables of all symbols of the session aligned by date, shared by all reruns
+    return load_panel([symbol.lower() for symbol in symbol_dict], session_name, orb_duration)
 
-    if first_symbol == second_symbol:
-        pass
 
-    df1 = pd.read_csv(file1, sep=";", index_col=[0], usecols=cols_to_use)
-    df2 = pd.read_csv(file2, sep=";", index_col=[0], usecols=cols_to_use)
+@st.cache_resource
+def get_session_cube(symbol, orb_duration):
+    # asia -> ldn -> ny day counts of the symbol (None if the cube has not been built)
+    return load_session_cube(symbol.lower(), orb_duration)
 
-    df_join = df1.join(df2, lsuffix=f"_{first_symbol}", rsuffix=f"_{second_symbol}", how="left")
 
-    return df_join
+def create_join_table(first_symbol, second_symbol):
+    return load_symbol_panel(session_dict.get(session), orb_duration).join_table(first_symbol.lower(),
+                                                                                  second_symbol.lower())
 
 
-def load_ml_model(symbol):
-    # load model
-    # try:
-    filepath_ml_model = os.path.join("ml_models",
-                                     f"{symbol.lower()}_{session_dict.get(session)}_simple_confirmation_bias_model.pickle")
-    filepath_ml_scaler = os.path.join("ml_models",
-                                      f"{symbol.lower()}_{session_dict.get(session)}_simple_confirmation_bias_scaler.pickle")
+@st.cache_resource
+def get_model_registry():
+    # One registry per server process, the models are loaded once and shared by all sessions
+    registry = ModelRegistry("ml_models")
+    if warm_up_ml_models:
+        registry.warm_up()
+    return registry
 
-    try:
-        loaded_model = pickle.load(open(filepath_ml_model, "rb"))
-        loaded_scaler = pickle.load(open(filepath_ml_scaler, "rb"))
 
-    except FileNotFoundError:
-        return 0, f"No trained model for {symbol} available"
+@st.cache_data
+def history_predictions(file_name, session_start, symbol, ml_session):
+    # Predictions for every day of the ORB table, scored in one call per dataset
+    df = load_data(file_name, session_start)
+    return get_model_registry().predict(symbol, ml_session, df["greenbox"], df["opening_level"], df["closing_level"])
+
 
-    return loaded_model, loaded_scaler
+def has_ml_model(symbol):
+    return ml_session is not None and get_model_registry().has_model(symbol.lower(), ml_session)
 
 
 with st.sidebar:
@@ -181,9 +277,14 @@ with st.sidebar:
                         "Tokyo (09:30 - 14:30 JST)"])
 
     orb_duration = st.sidebar.selectbox("Choose Opening Range Duration", [60, 30])
-
-    file = os.path.join("data", f"{symbol.lower()}_{session_dict.get(session)}_{orb_duration}.csv")
-    df = load_data(file)
+    window_minutes = st.sidebar.selectbox("Choose Time Window Size (minutes)", [15, 30, 60])
+
+    session_start = session_start_times[session_dict.get(session)]
+    file = os.path.join("data", f"{symbol.lower()}_{session_dict.get(session)}_{orb_duration}")
+    df, filter_index = load_filter_table(file, session_start, window_minutes)
+    dataset_id = (file, window_minutes)
+    ml_session = ml_sessions.get(session_dict.get(session))
+    rows = filter_index.all_rows
     st.divider()
 
 breakout = True
@@ -203,16 +304,16 @@ with select2:
         # st.selectbox("Select day?", ["None"])
     elif data_filter == "By Day":
         day_options = {0: "Monday", 1: "Tuesday", 2: "Wednesday", 3: "Thursday", 4: "Friday"}
-        day = st.selectbox("Select day?", np.unique(df.index.weekday), format_func=lambda x: day_options.get(x))
-        df = df[df.index.weekday == day]
+        day = st.selectbox("Select day?", filter_index.values("weekday"), format_func=lambda x: day_options.get(x))
+        rows = rows & filter_index.select("weekday", [day])
     elif data_filter == "By Month":
         month_options = {1: "January", 2: "February", 3: "March", 4: "April", 5: "May", 6: "June", 7: "July",
                          8: "August", 9: "September", 10: "Oktober", 11: "November", 12: "December"}
-        month = st.selectbox("Select month?", np.unique(df.index.month), format_func=lambda x: month_options.get(x))
-        df = df[df.index.month == month]
+        month = st.selectbox("Select month?", filter_index.values("month"), format_func=lambda x: month_options.get(x))
+        rows = rows & filter_index.select("month", [month])
     else:
-        year = st.selectbox("Select year?", np.unique(df.index.year))
-        df = df[df.index.year == year]
+        year = st.selectbox("Select year?", filter_index.values("year"))
+        rows = rows & filter_index.select("year", [year])
 
 with select3:
     st.empty()
@@ -229,26 +330,21 @@ col1, col2, col3 = st.columns(3)
 
 with col1:
     orb_side = st.radio("Range breakout side", ("All", "Long", "Short"))
-    if orb_side == "Long":
-        df = df.loc[df.upday]
-
-    elif orb_side == "Short":
-        df = df[(~df.upday) & (df["breakout_time"].notna())]
-    else:
-        pass
+    if orb_side != "All":
+        rows = rows & filter_index.select("side", [orb_side])
 
 with col2:
     greenbox = st.radio("Greenbox true", ("All", "True", "False"))
     if greenbox == "True":
-        df = df[df.greenbox]
+        rows = rows & filter_index.select("greenbox", [True])
     elif greenbox == "False":
-        df = df[~df.greenbox]
+        rows = rows & filter_index.select("greenbox", [False])
     else:
         st.empty()
 
 with col3:
 
-    model_list = list(df.model.dropna().unique()) + ["All Models", "All Upside Models", "All Downside Models", "Upside + Expansion", "Downside + Expansion"]
+    model_list = [model_labels[code] for code in filter_index.values("model", rows) if code != 0] + ["All Models", "All Upside Models", "All Downside Models", "Upside + Expansion", "Downside + Expansion"]
     model_list.sort()
 
     model_filter = st.selectbox("Filter by Session Model",
@@ -272,26 +368,34 @@ with col3:
 
 model_filter = model_filter + ["No Model"]
 
-df["breakout_window"] = df["breakout_window"].fillna("No Breakout")
-df["model"] = df["model"].fillna("No Model")
-time_windows = (df["breakout_window"].unique())
-breakout_time = st.multiselect("Breakout time of the day", time_windows, default=time_windows)
+time_windows = filter_index.values("breakout_window", rows)
+breakout_time = st.multiselect("Breakout time of the day", time_windows, default=time_windows,
+                               format_func=format_window)
 
-df = df[(df.breakout_window.isin(breakout_time)) &
-        (df.model.isin(model_filter))]
+# The table is sliced once with the combined filters
+model_filter_codes = [model_codes.get(model, 0) for model in model_filter]  # "No Model" is the "None" model
+rows = rows & filter_index.select("breakout_window", breakout_time) & filter_index.select("model", model_filter_codes)
+positions = filter_index.positions(rows)
+df = df.take(positions)
+filter_signature = filter_index.signature(rows)
+result_cache = get_result_cache()
 
 
 data_points = len(df.index)
 inv_param = [False if orb_side == "Long" else True][0]
 
-general_tab, distribution_tab, model, strategy_tester, strategy_rules, faq_tab, disclaimer, ml, = \
-    st.tabs(["General Statistics", "Distribution", "Model Section", "Stategy Backtester", "Strategy Rules", "FAQ",
-             "Disclaimer", "Machine Learning", ])
+general_tab, distribution_tab, model, strategy_tester, cross_symbol_tab, strategy_rules, faq_tab, disclaimer, ml, = \
+    st.tabs(["General Statistics", "Distribution", "Model Section", "Stategy Backtester", "Cross Symbol",
+             "Strategy Rules", "FAQ", "Disclaimer", "Machine Learning", ])
 
 if len(df) == 0:
     st.error("No data has been selected. Please change the filter settings .")
     st.stop()
 
+# Breakout, retracement and expansion time statistics of the filtered data (used by all tabs)
+time_stats = {col: cached_result("time_statistics", lambda: time_statistics(df[col]), col)
+              for col in time_cols}
+
 with general_tab:
     col1, col2, col3, col4 = st.columns(4)
 
@@ -345,20 +449,17 @@ with general_tab:
                   help="Compares the size of the Opening Range with the opening range size of the previous session.")
 
     with col8:
-        st.empty()
+        breakout_stats = time_stats["breakout_time"]
+        st.metric("Breakout time (p25 - p75)",
+                  f"{time_of_day_label(breakout_stats['p25'])} - {time_of_day_label(breakout_stats['p75'])}",
+                  help="Half of the breakouts happen in this time span. " + time_quantiles_help(breakout_stats))
 
 with distribution_tab:
     use_orb_body = st.toggle("Use candle bodys for OR calculation",
                               help="Uses bodys to determine the opening range instead of wicks.")
 
     #Retracement/Expansion DF
-    df_ret = df[["retracement_window", "max_expansion_time"]].groupby(["retracement_window"]).count()
-    df_ret["pct"] = df_ret["max_expansion_time"] / df_ret["max_expansion_time"].sum()
-    df_exp = df[["max_retracement_time", "expansion_window"]].groupby(["expansion_window"]).count()
-    df_exp["pct"] = df_exp["max_retracement_time"] / df_exp["max_retracement_time"].sum()
-
-    df_ret = df_ret.join(df_exp, lsuffix=" retracement", rsuffix=" expansion")
-    df_ret = df_ret.fillna(0)
+    df_ret = cached_result("overtake_df", create_overtake_df)
 
     if use_orb_body:
         st.session_state["use_orb_body"] = True
@@ -368,9 +469,10 @@ with distribution_tab:
     range_dis, col3, col4, col5,  = st.columns(4)
     with col3:
 
-        median_time = median_time_calcualtion(df["breakout_time"])
-        st.metric("Median breakout time:", value=str(median_time),
-                  delta=f"Mode breakout time: {df.breakout_time.mode()[0]}")
+        breakout_stats = time_stats["breakout_time"]
+        st.metric("Median breakout time:", value=time_of_day_label(breakout_stats["median"]),
+                  delta=f"Mode breakout time: {time_of_day_label(breakout_stats['mode'])}",
+                  help=time_quantiles_help(breakout_stats))
         breakout = st.button("See Distribution", key="breakout")
 
         if breakout:
@@ -380,15 +482,15 @@ with distribution_tab:
             st.session_state['range_button'] = False
 
     with col4:
-        median_retracement = median_time_calcualtion(df["max_retracement_time"])
+        retracement_stats = time_stats["max_retracement_time"]
         if st.session_state["use_orb_body"]:
             median_retracement_value = df.retracement_level_body.median()
         else:
             median_retracement_value = df.retracement_level.median()
 
-        st.metric("Median retracement before HoS/LoS:", value=str(median_retracement),
+        st.metric("Median retracement before HoS/LoS:", value=time_of_day_label(retracement_stats["median"]),
                   delta=f"Median retracement value: {median_retracement_value}",
-                  )
+                  help=time_quantiles_help(retracement_stats))
         retracement = st.button("See Distribution", key="retracement")
 
         if retracement:
@@ -399,16 +501,16 @@ with distribution_tab:
 
     with col5:
 
-        median_expansion = median_time_calcualtion(df["max_expansion_time"])
+        expansion_stats = time_stats["max_expansion_time"]
 
         if st.session_state["use_orb_body"]:
             median_expansion_value = df.expansion_level_body.median()
         else:
             median_expansion_value = df.expansion_level.median()
 
-        st.metric("Median time of max expansion:", value=str(median_expansion),
+        st.metric("Median time of max expansion:", value=time_of_day_label(expansion_stats["median"]),
                   delta=f"Median expansion value: {median_expansion_value}",
-                  )
+                  help=time_quantiles_help(expansion_stats))
         expansion = st.button("See distribution", key="expansion")
 
         if expansion:
@@ -434,21 +536,21 @@ with distribution_tab:
 
     if st.session_state['breakout_button']:
         st.write("**Distribution of opening range breakout**")
-        st.bar_chart(create_plot_df(df, "breakout_window"), y="pct", color=bar_color)
+        st.bar_chart(cached_plot_df("breakout_window").rename(index=format_window), y="pct", color=bar_color)
     elif st.session_state['retracement_button']:
 
         tab_chart, tab_data = st.tabs(["📈 Chart", "🗃 Data"])
 
         if orb_side == "Short":
             if not st.session_state['use_orb_body']:
-                df2 = create_plot_df(df, "retracement_level", inverse_percentile=False, ascending=True)
+                df2 = cached_plot_df("retracement_level", inverse_percentile=False, ascending=True)
             else:
-                df2 = create_plot_df(df, "retracement_level_body", inverse_percentile=False, ascending=True)
+                df2 = cached_plot_df("retracement_level_body", inverse_percentile=False, ascending=True)
         else:
             if not st.session_state["use_orb_body"]:
-                df2 = create_plot_df(df, "retracement_level", inverse_percentile=True)
+                df2 = cached_plot_df("retracement_level", inverse_percentile=True)
             else:
-                df2 = create_plot_df(df, "retracement_level_body", inverse_percentile=True)
+                df2 = cached_plot_df("retracement_level_body", inverse_percentile=True)
 
         with tab_chart:
 
@@ -472,18 +574,11 @@ with distribution_tab:
                                     value=False,
                                     key="minute")
             if use_minutes:
-                ret_df = df.groupby("retracement_in_minutes").agg({"max_retracement_time": "count"}).reset_index()
-                ret_df = ret_df.rename(columns={"max_retracement_time": "count"})
-                ret_df["percentile"] = ret_df["count"].cumsum() / ret_df["count"].sum()
-                ret_df = ret_df.set_index("retracement_in_minutes")
+                ret_df = cached_plot_df("retracement_in_minutes", count_column="max_retracement_time")
                 x_title = "Max Retracement in minutes after breakout"
             else:
-                ret_df = df.groupby("retracement_window").agg({"retracement_in_minutes": "count"}).reset_index()
-                ret_df = ret_df.rename(columns={"retracement_in_minutes": "count"})
-                #ret_df["retracement_window"] = ret_df["retracement_window"].astype(str)
-
-                ret_df["percentile"] = ret_df["count"].cumsum() / ret_df["count"].sum()
-                ret_df = ret_df.set_index("retracement_window")
+                ret_df = cached_plot_df("retracement_window", count_column="retracement_in_minutes")
+                ret_df = ret_df.rename(index=format_window)
                 x_title = "Max Retracement Time"
 
             fig2 = create_plotly_plot(df=ret_df,
@@ -504,6 +599,7 @@ with distribution_tab:
 
         if overtake_percentile:
             #### Optional ? Overtake approach?
+            df_ret = df_ret.copy()  # the cached table stays unchanged
             df_ret["pct retracement"] = 1 - (df_ret["pct retracement"].cumsum())
             df_ret["pct expansion"] = df_ret["pct expansion"].cumsum()
 
@@ -512,14 +608,14 @@ with distribution_tab:
 
         if orb_side == "Short":
             if not st.session_state['use_orb_body']:
-                df2 = create_plot_df(df, "expansion_level", inverse_percentile=True, ascending=False)
+                df2 = cached_plot_df("expansion_level", inverse_percentile=True, ascending=False)
             else:
-                df2 = create_plot_df(df, "expansion_level_body", inverse_percentile=True, ascending=False)
+                df2 = cached_plot_df("expansion_level_body", inverse_percentile=True, ascending=False)
         else:
             if not st.session_state['use_orb_body']:
-                df2 = create_plot_df(df, "expansion_level", inverse_percentile=False)
+                df2 = cached_plot_df("expansion_level", inverse_percentile=False)
             else:
-                df2 = create_plot_df(df, "expansion_level_body", inverse_percentile=False)
+                df2 = cached_plot_df("expansion_level_body", inverse_percentile=False)
 
         tab_chart, tab_data = st.tabs(["📈 Chart", "🗃 Data"])
 
@@ -543,20 +639,14 @@ with distribution_tab:
                                     key="minute2")
 
             if st.session_state["minute2"]:
-                exp_df = df.groupby("expansion_in_minutes").agg({"max_expansion_time": "count"}).reset_index()
-                exp_df = exp_df.rename(columns={"max_expansion_time": "count"})
-                exp_df = exp_df.set_index("expansion_in_minutes")
+                exp_df = cached_plot_df("expansion_in_minutes", count_column="max_expansion_time")
                 x_title = "Max Expansion Time"
             else:
 
-                exp_df = df.groupby("expansion_window").agg({"expansion_in_minutes": "count"}).reset_index()
-                exp_df = exp_df.rename(columns={"expansion_in_minutes": "count"})
-                # exp_df["max_expansion_time"] = exp_df["max_expansion_time"].astype(str)
-                exp_df = exp_df.set_index("expansion_window")
+                exp_df = cached_plot_df("expansion_window", count_column="expansion_in_minutes")
+                exp_df = exp_df.rename(index=format_window)
                 x_title = "Max Expansion Time"
 
-            exp_df["percentile"] = exp_df["count"].cumsum() / exp_df["count"].sum()
-
             fig3 = create_plotly_plot(df=exp_df,
                                       title="Distribution of max expansion time before high/low of the session",
                                       x_title=x_title,
@@ -566,7 +656,7 @@ with distribution_tab:
                                       )
 
             st.plotly_chart(fig3, use_container_width=True)
-            st.write(f"Median max expansion time is: {median_time_calcualtion(df.max_expansion_time)}")
+            st.write(f"Median max expansion time is: {time_of_day_label(time_stats['max_expansion_time']['median'])}")
 
             st.divider()
             st.write("**Extention/Retracement Time Overtake**")
@@ -576,10 +666,7 @@ with distribution_tab:
             st.dataframe(df2)
     elif st.session_state['range_button']:
 
-        range_group = df.groupby("range_multiplier").agg({"range_holds": "count"})
-        range_group = range_group.rename(columns={"range_holds": "count"})
-        range_group["pct"] = range_group["count"] / range_group["count"].sum()
-        range_group["percentile"] = range_group["pct"].cumsum()
+        range_group = cached_plot_df("range_multiplier", count_column="range_holds")
         range_group = range_group[range_group.index <=5]
        # st.bar_chart(range_group, x="range_multiplier", y="pct")
 
@@ -605,8 +692,7 @@ with model:
         st.image(os.path.join("pictures", "downtrend.png"))
         st.subheader("Other Models")
         st.image(os.path.join("pictures", "others.png"))
-    order = ["Weak Uptrend", "Medium Uptrend", "Strong Uptrend", "Expansion", "Contraction", "Weak Downtrend",
-             "Medium Downtrend", "Strong Downtrend", ]
+    order = list(model_labels[1:])
 
     if (len(model_filter)-1 is not len(order)) or \
             (orb_side != "All") or (greenbox != "All"):
@@ -615,14 +701,6 @@ with model:
                    "Therefore, please do not set a breakout side, greenbox or model filter. "
                    "Otherwise, these filters will reduce the amount of data from which the models can be formed and may lead to incorrect results. ")
     else:
-
-        model_df = df[["model", "model_prev", "upday_prev", "range_holds_prev", "upday"]].dropna()
-
-        order = ["Weak Uptrend", "Medium Uptrend", "Strong Uptrend", "Expansion", "Contraction", "Weak Downtrend",
-                 "Medium Downtrend", "Strong Downtrend", ]
-        model_df["model"] = pd.Categorical(model_df["model"], categories=order, ordered=True)
-        model_df["model_prev"] = pd.Categorical(model_df["model_prev"], categories=order, ordered=True)
-
         mds_col, md_true_col, md_up_col = st.columns(3)
         with mds_col:
             prev_md = st.selectbox("Choose Previous Model", order)
@@ -634,14 +712,31 @@ with model:
         scenario_sel = st.multiselect("Potential scenarios for current session", order, order,
                                       help="Deselect models that can not happen anymore")
 
-        model_df = model_df[
-            (model_df.model_prev == prev_md) &
-            (model_df.upday_prev == is_md_up) &
-            (model_df.range_holds_prev == is_md_true) &
-            (model_df["model"].isin(scenario_sel))
-            ]
-
-        model_df = model_df.groupby("model").agg({"model_prev": "count", "upday": "sum"}).reset_index()
+        session_name = session_dict.get(session)
+        cube = get_session_cube(symbol, orb_duration)
+        if cube is not None and session_name in prev_legs and len(positions) == filter_index.size:
+            # Total dataset: number of days per model and breakout side from the precomputed session cube
+            prev_leg = prev_legs[session_name]
+            counts = cube.query({(prev_leg, "model"): model_codes[prev_md],
+                                 (prev_leg, "upday"): int(is_md_up),
+                                 (prev_leg, "range_holds"): int(is_md_true)},
+                                by=[(session_name, "model"), (session_name, "upday")])[:missing_model]
+            days, updays = counts.sum(axis=1), counts[:, 1]
+        else:
+            # number of days per model code (and up days) of the filtered table
+            model_df = df[["model", "model_prev", "upday_prev", "range_holds_prev", "upday"]].dropna()
+            model_df = model_df[
+                (model_df.model_prev == model_codes[prev_md]) &
+                (model_df.upday_prev == is_md_up) &
+                (model_df.range_holds_prev == is_md_true)
+                ]
+            days = np.bincount(model_df["model"], minlength=missing_model)
+            updays = np.bincount(model_df["model"], weights=model_df["upday"].astype(float),
+                                 minlength=missing_model).astype(int)
+        model_df = pd.DataFrame({"model": pd.Categorical(model_labels[1:], categories=order, ordered=True),
+                                 "model_prev": days[1:],
+                                 "upday": updays[1:]})
+        model_df = model_df[model_df["model"].isin(scenario_sel)]
         model_df = model_df[model_df["model_prev"] != 0]
         model_df["pct"] = model_df["model_prev"] / model_df["model_prev"].sum()
         model_df["pct_upday"] = model_df["upday"] / model_df["model_prev"]
@@ -664,11 +759,17 @@ with model:
         else:
             # Schritt 1: Knoten und ihre Indizes
 
+            # Nodes in order of appearance: previous models, models, breakout side. The "None" model has no
+            # previous session node and is "No Model" as current model.
             df_sankey = df[["model_prev", "model", "upday"]].dropna()
-            df_sankey['model_prev'] = df_sankey['model_prev'] + "_prev_session"
-            #df_sankey['model'] = df_sankey['model'] +
-
-            all_labels = list(pd.concat([df_sankey['model_prev'], df_sankey['model'], df_sankey['upday']]).unique())  # order
+            df_sankey = df_sankey[df_sankey["model_prev"] != 0]
+            prev_nodes, prev_codes = pd.factorize(df_sankey["model_prev"])
+            model_nodes, node_codes = pd.factorize(df_sankey["model"])
+            upday_nodes, upday_values = pd.factorize(df_sankey["upday"])
+
+            all_labels = [model_labels[code] + "_prev_session" for code in prev_codes] + \
+                         ["No Model" if code == 0 else model_labels[code] for code in node_codes] + \
+                         upday_values.tolist()
             label_indices = {label: idx for idx, label in enumerate(all_labels)}
             st.write(label_indices)
             # st.write(all_labels)
@@ -676,19 +777,16 @@ with model:
 
             # Schritt 2: Links erstellen (von source nach target)
 
-            df_sankey['source'] = df_sankey['model_prev'].map(label_indices)
-            df_sankey['target'] = df_sankey['model'].map(label_indices)
-            df_sankey['target2'] = df_sankey['upday'].map(label_indices)
-            df_sankey["prev_model2"] = df_sankey['model_prev'].replace("_prev_session", "", regex=True)
-
-
-            df_sankey = df_sankey[(df_sankey['model'].isin(scenario_sel)) &
-                                  (df_sankey['prev_model2'] == prev_md)]
+            links = np.column_stack([prev_nodes,
+                                     len(prev_codes) + model_nodes,
+                                     len(prev_codes) + len(node_codes) + upday_nodes])
+            links = links[df_sankey["model"].isin([model_codes[model] for model in scenario_sel]).to_numpy() &
+                          (df_sankey["model_prev"] == model_codes[prev_md]).to_numpy()]
 
             # Schritt 3: Häufigkeiten der Verbindungen berechnen
-            link_data = df_sankey.groupby(['source', 'target', 'target2']).agg(
-                value=('upday', 'size'),  # Anzahl der Zeilen in jeder Gruppe
-            ).reset_index()
+            links, values = np.unique(links.reshape(-1, 3), axis=0, return_counts=True)
+            link_data = pd.DataFrame({"source": links[:, 0], "target": links[:, 1], "target2": links[:, 2],
+                                      "value": values})
 
             color_dict = {
                 "Weak Uptrend": "#70AD47",
@@ -757,132 +855,155 @@ with strategy_tester:
             else:
                 tp = st.number_input("What is your take profit level:", step=0.1, value=1.5)
 
-        if orb_side == "Long":
-            # Filter dataframe
-            # entries on retracement before hos or after high of the session
-            strat_df = df[(df.retracement_level <= buy_in) |
-                          ((df.retracement_level > buy_in) & (df.after_conf_min_level <= buy_in))]
-
-            strat_df = strat_df[
-                ["after_conf_max_level", "after_conf_min_level", "session_close_level", "retracement_level",
-                 "expansion_level"]]
-            # direct sl trades
-            sl_df = strat_df[(strat_df.retracement_level <= sl) |
-                             ((strat_df.retracement_level > sl) &
-                              (strat_df.after_conf_min_level <= sl))
-                             ]
-
-            # tp trades
-            tp_df = strat_df[(strat_df.expansion_level >= tp) & (strat_df.retracement_level > sl)]
-
-            # delete sl from tp trades
-            tp_df = tp_df.drop(sl_df.index, axis='index', errors="ignore")
-
-            # delete sl and tp trades from overall df
-            part_df = strat_df.drop(sl_df.index, axis='index')
-            part_df = part_df.drop(tp_df.index, axis='index')
-
-            # partial wins
-            part_win_df = part_df[part_df.session_close_level >= buy_in]
-            part_loss_df = part_df[part_df.session_close_level < buy_in]
-
-
-        else:
-            # Filter dataframe
-            # entries on retracement before hos or after low of the session
-            strat_df = df[(df.retracement_level >= buy_in) |
-                          ((df.retracement_level < buy_in) & (df.after_conf_max_level > buy_in))]
-            strat_df = strat_df[
-                ["after_conf_max_level", "after_conf_min_level", "session_close_level", "retracement_level",
-                 "expansion_level"]]
-
-            # sl trades
-            sl_df = strat_df[(strat_df.retracement_level >= sl) |
-                             (strat_df.retracement_level < sl) &
-                             (strat_df.after_conf_max_level >= sl)
-                             ]
-            # tp trades
-            tp_df = strat_df[(strat_df.expansion_level <= tp) & (strat_df.retracement_level < sl)]
-
-            # delete sl from tp trades
-            tp_df = tp_df.drop(sl_df.index, axis='index', errors="ignore")
-
-            # delete sl and tp trades from overall df
-            part_df = strat_df.drop(sl_df.index, axis='index')
-            part_df = part_df.drop(tp_df.index, axis='index')
-
-            # partial wins
-            part_win_df = part_df[part_df.session_close_level <= buy_in]
-            part_loss_df = part_df[part_df.session_close_level > buy_in]
-
-            # calc kpis
-        trade_count = len(strat_df.index)
-        sl_count = len(sl_df.index)
-        tp_count = len(tp_df.index)
-        part_loss_count = len(part_loss_df.index)
-        part_win_count = len(part_win_df.index)
-
-        win_rate = (part_win_count + tp_count) / trade_count
-        target_tp = abs(buy_in - tp) / abs(buy_in - sl)
+        # one classification pass: outcome code and realized risk multiple of every day
+        outcome, realized_r = level_outcomes(df, orb_side.lower(), buy_in, sl, tp)
+        kpis = trade_kpis(outcome, realized_r, buy_in, sl, tp)
+        equity, traded = equity_curve(outcome, realized_r)
+        target_tp = kpis["target_r"]
 
         trades, hit_tp, hit_sl, part_tp, part_sl = st.columns(5)
 
         with trades:
-            st.metric("#Trades", trade_count)
+            st.metric("#Trades", kpis["trades"])
         with hit_tp:
-            st.metric("Take Profit Hits", tp_count)
+            st.metric("Take Profit Hits", kpis["tp_count"])
         with hit_sl:
-            st.metric("Stop Loss Hits", sl_count)
+            st.metric("Stop Loss Hits", kpis["sl_count"])
         with part_tp:
-            st.metric("Partial Wins", part_win_count)
+            st.metric("Partial Wins", kpis["part_win_count"])
         with part_sl:
-            st.metric("Partial Losses", part_loss_count)
+            st.metric("Partial Losses", kpis["part_loss_count"])
 
         winrate, profit_factor, target_rr, avg_rr, real_r = st.columns(5)
 
         with winrate:
-            st.metric("Winrate", f"{win_rate:.1%}")
+            st.metric("Winrate", f"{kpis['win_rate']:.1%}")
         with profit_factor:
-            win_r = (tp_count * target_tp) + (abs(part_win_df.session_close_level - buy_in).sum())
-            loss_r = (sl_count + abs(part_loss_df.session_close_level - buy_in).sum())
-
-            profit_fact = win_r / loss_r
-            st.metric("Proft Factor:", f"{profit_fact: .2f}")
-
+            st.metric("Proft Factor:", f"{kpis['profit_factor']: .2f}")
         with target_rr:
             st.metric("Target Risk Multiple", f"{target_tp:.2f}")
         with avg_rr:
-
-            if orb_side == "Long":
-                real_par_rr = (np.array(part_df.session_close_level) - buy_in) / abs(buy_in - sl)
-            else:
-                real_par_rr = (np.array(buy_in - part_df.session_close_level)) / abs(buy_in - sl)
-            avg_risk_reward = ((tp_count * target_tp) + (sl_count * -1) + sum(real_par_rr)) / trade_count
-
-            st.metric("Avg. Realized Risk Multiple", f"{avg_risk_reward: .2f}")
+            st.metric("Avg. Realized Risk Multiple", f"{kpis['avg_r']: .2f}")
         with real_r:
-
             # Equity Curve
-            sl_df["R"] = -1
-
-            tp_df["R"] = target_tp
-            part_df["R"] = real_par_rr
-
-            eq_curve = pd.concat([sl_df, tp_df, part_df])
-            eq_curve = eq_curve.sort_index(ascending=True)
-            eq_curve["Risk Reward"] = eq_curve.R.cumsum()
-            st.metric("Realized Risk Reward", f"{eq_curve.R.sum(): .2f}")
+            eq_curve = df.iloc[traded][["after_conf_max_level", "after_conf_min_level", "session_close_level",
+                                        "retracement_level", "expansion_level"]]
+            eq_curve = eq_curve.assign(R=realized_r[traded], **{"Risk Reward": equity})
+            st.metric("Realized Risk Reward", f"{kpis['realized_r']: .2f}")
+
+        trade_r = np.nan_to_num(realized_r[traded])
+        risk = risk_summary(trade_r)
+        drawdown, drawdown_duration, win_streak, loss_streak, r_ratio = st.columns(5)
+
+        with drawdown:
+            st.metric("Max Drawdown (R)", f"{risk['max_drawdown']:.2f}")
+        with drawdown_duration:
+            st.metric("Max Drawdown Duration", f"{risk['max_drawdown_duration']} Trades")
+        with win_streak:
+            st.metric("Longest Win Streak", risk["longest_win_streak"])
+        with loss_streak:
+            st.metric("Longest Loss Streak", risk["longest_loss_streak"])
+        with r_ratio:
+            st.metric("R Ratio", f"{risk['r_ratio']:.2f}", help="Mean realized risk multiple per trade divided "
+                                                                 "by its standard deviation (Sharpe ratio like)")
 
         st.divider()
 
-        tab_chart, tab_data = st.tabs(["📈 Chart", "🗃 Data"])
+        tab_chart, tab_risk, tab_data = st.tabs(["📈 Chart", "📊 Risk", "🗃 Data"])
         with tab_chart:
             st.write("**Equity Curve**")
             st.line_chart(eq_curve, y="Risk Reward", use_container_width=True)
 
+        with tab_risk:
+            rolling_window = st.selectbox("Rolling winrate over the last trades", [10, 20, 50, 100], index=1)
+            st.write("**Rolling Winrate**")
+            st.line_chart(pd.DataFrame({"Winrate": rolling_win_rate(trade_r, rolling_window)},
+                                       index=eq_curve.index), use_container_width=True)
+
+            trade_dates = eq_curve.index
+            col_weekday, col_month = st.columns(2)
+            with col_weekday:
+                expectancy, trade_count = grouped_expectancy(trade_r, trade_dates.weekday, 7)
+                fig = px.bar(x=["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"], y=expectancy[:5],
+                             color_discrete_sequence=[bar_color],
+                             labels={"x": "Weekday", "y": "Expectancy (R per trade)"},
+                             hover_data={"Trades": trade_count[:5]}, title="Expectancy by Weekday")
+                st.plotly_chart(fig, use_container_width=True)
+            with col_month:
+                expectancy, trade_count = grouped_expectancy(trade_r, trade_dates.month - 1, 12)
+                fig = px.bar(x=["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"],
+                             y=expectancy, color_discrete_sequence=[bar_color],
+                             labels={"x": "Month", "y": "Expectancy (R per trade)"},
+                             hover_data={"Trades": trade_count}, title="Expectancy by Month")
+                st.plotly_chart(fig, use_container_width=True)
+
         with tab_data:
             eq_curve = eq_curve.drop("Risk Reward", axis=1)
             st.dataframe(eq_curve)
+
+        st.divider()
+        if st.toggle("Level sweep",
+                     help="Backtest every buy in, stop loss and take profit level between -1.0 and 3.0 (0.1 steps) "
+                          "with the rules above"):
+            sweep = cached_result("level_sweep", lambda: level_sweep(df, orb_side.lower()), orb_side)
+            sweep_levels = sweep["levels"]
+            sweep_buy_in = np.flatnonzero(np.isclose(sweep_levels, buy_in))
+            if len(sweep_buy_in) == 0:
+                st.info(f"The {'sell' if orb_side == 'Short' else 'buy'} in level has to be on the sweep grid "
+                        f"({sweep_levels[0]} to {sweep_levels[-1]} in 0.1 steps).")
+            else:
+                sweep_buy_in = sweep_buy_in[0]
+                st.write(f"**Stop loss and take profit levels for an entry at {buy_in}**")
+                tab_win_rate, tab_profit_factor, tab_real_r, tab_drawdown = st.tabs(
+                    ["Winrate", "Profit Factor", "Realized Risk Reward", "Max Drawdown"])
+                with tab_win_rate:
+                    st.plotly_chart(create_sweep_heatmap(sweep["win_rate"][sweep_buy_in], sweep_levels,
+                                                         "Winrate", "Blues"),
+                                    use_container_width=True)
+                with tab_profit_factor:
+                    st.plotly_chart(create_sweep_heatmap(sweep["profit_factor"][sweep_buy_in], sweep_levels,
+                                                         "Profit Factor", "RdBu", midpoint=1),
+                                    use_container_width=True)
+                with tab_real_r:
+                    st.plotly_chart(create_sweep_heatmap(sweep["realized_r"][sweep_buy_in], sweep_levels,
+                                                         "Realized Risk Reward", "RdBu", midpoint=0),
+                                    use_container_width=True)
+                with tab_drawdown:
+                    sweep_drawdown = cached_result("sweep_risk", lambda: sweep_risk(df, orb_side.lower(), buy_in),
+                                                   orb_side, buy_in)["max_drawdown"]
+                    st.plotly_chart(create_sweep_heatmap(sweep_drawdown, sweep_levels, "Max Drawdown (R)", "Reds"),
+                                    use_container_width=True)
+
+        st.divider()
+        if st.toggle("Bootstrap",
+                     help="Resamples whole weeks or months of the trades above with replacement to show how much "
+                          "the results depend on the historical order of the trades"):
+            col_block, col_samples = st.columns(2)
+            with col_block:
+                block = st.selectbox("Resampled blocks", ["Week", "Month"])
+            with col_samples:
+                samples = st.selectbox("Number of samples", [1000, 2000, 5000, 10000], index=1)
+
+            bootstrap = run_with_progress(
+                lambda progress: cached_result(
+                    "bootstrap",
+                    lambda: block_bootstrap(df.index.values, outcome, realized_r, buy_in, sl, tp, block.lower(),
+                                            samples, progress=progress),
+                    buy_in, sl, tp, block, samples),
+                "Resampling trades")
+            intervals = bootstrap_intervals(bootstrap)
+            history = [kpis["win_rate"], kpis["profit_factor"], risk["max_drawdown"], kpis["realized_r"]]
+            st.dataframe(pd.DataFrame(
+                [[value] + list(intervals[name]) for name, value in zip(intervals, history)],
+                index=["Winrate", "Profit Factor", "Max Drawdown (R)", "Realized Risk Reward"],
+                columns=["Backtest", "p5", "Median", "p95"]).round(3),
+                use_container_width=True)
+            fig = px.histogram(x=bootstrap["final_r"], nbins=50, color_discrete_sequence=[bar_color],
+                               labels={"x": "Realized Risk Reward"},
+                               title=f"Realized Risk Reward of {samples} resampled histories")
+            fig.add_vline(x=kpis["realized_r"], line_color=line_color)
+            fig.update_layout(yaxis_title="Samples")
+            st.plotly_chart(fig, use_container_width=True)
     st.caption(
         "Please note that the results generated by this backtesting tool may not perfectly reflect real-world trading outcomes. "
         "\nUnlike candle-to-candle backtesting methods, which analyze each individual candle's data, this tool utilizes vectorized "
@@ -894,6 +1015,40 @@ with strategy_tester:
         "rather than a definitive prediction of actual trading performance. "
         )
 
+with cross_symbol_tab:
+    panel = load_symbol_panel(session_dict.get(session), orb_duration)
+    panel_symbols = [symbol.upper() for symbol in panel.symbols]
+    relation = st.selectbox("Which relation between the symbols do you want to see?",
+                            ["Long breakouts", "Short breakouts", "Same breakout side", "Same greenbox",
+                             "Level correlation"])
+    # only the days of the current filter selection
+    if relation == "Long breakouts":
+        matrix = panel.conditional("side", long_side, df.index)
+        explanation = "When the symbol of the row breaks long, how often does the symbol of the column break long?"
+    elif relation == "Short breakouts":
+        matrix = panel.conditional("side", short_side, df.index)
+        explanation = "When the symbol of the row breaks short, how often does the symbol of the column break short?"
+    elif relation == "Same breakout side":
+        matrix = panel.agreement("side", df.index)
+        explanation = "How often do both symbols break out to the same side (or both hold the range)?"
+    elif relation == "Same greenbox":
+        matrix = panel.agreement("greenbox", df.index)
+        explanation = "How often do both symbols have the same opening range candle color?"
+    else:
+        level_field = st.selectbox("Level", level_fields, format_func=lambda x: x.replace("_", " ").title())
+        matrix = panel.correlation(level_field, df.index)
+        explanation = "Correlation of the level of both symbols on the days both symbols traded."
+
+    st.write(f"**{explanation}**")
+    fig = px.imshow(matrix, x=panel_symbols, y=panel_symbols, zmin=-1 if relation == "Level correlation" else 0,
+                    zmax=1, text_auto=".0%" if relation != "Level correlation" else ".2f", aspect="auto",
+                    color_continuous_scale="RdBu" if relation == "Level correlation" else "Blues",
+                    labels={"x": "Symbol", "y": "Given symbol", "color": relation})
+    fig.update_layout(height=600)
+    st.plotly_chart(fig, use_container_width=True)
+    st.caption(f"Based on the days of the current filter selection of {symbol} ({session}, "
+               f"{orb_duration} minute opening range). Symbols without data on these days stay empty.")
+
 with ml:
     st.write(
         "This section is still in the very early stages of testing and should never be used as a reference. It should rather be seen as a technical gimmick. ")
@@ -906,19 +1061,36 @@ with ml:
     # st.write(gbox[0])
     pred_values = [[1 if greenbox == "True" else 0][0], open_level, close_level]
 
-    model, scaler = load_ml_model(symbol)
-    if model == 0:
-        st.subheader(scaler)
+    if not has_ml_model(symbol):
+        st.subheader(f"No trained model for {symbol} available")
     else:
-
-        pred_values = scaler.transform([pred_values])
-
-        y_predicted = model.predict(pred_values)
+        # The inputs are on the lookup grid of the model, no scikit-learn model has to be loaded
+        registry = get_model_registry()
+        y_predicted = registry.predict(symbol.lower(), ml_session, *[[value] for value in pred_values])
+        long_probability = registry.predict(symbol.lower(), ml_session, *[[value] for value in pred_values],
+                                            probability=True)
         st.divider()
         if y_predicted[0] == 0:
             st.subheader("The machine learning model predicts a :red[short] breakout for this session!")
         else:
             st.subheader("The machine learning model predicts a :red[long] breakout for this session!")
+        st.caption(f"Probability of a long breakout: {long_probability[0]:.0%}")
+
+        # Model performance on the selected days with a breakout
+        st.divider()
+        st.write("**Predictions of the model for the selected days**")
+        predictions = history_predictions(file, session_start, symbol.lower(), ml_session)[positions]
+        scored = ~np.isnan(predictions) & df["breakout_time"].notna().to_numpy()
+        hits = predictions[scored] == df["upday"].to_numpy()[scored]
+
+        scored_col, hit_col, long_col = st.columns(3)
+        scored_col.metric("Scored days", int(scored.sum()))
+        hit_col.metric("Hit rate", f"{hits.mean():.1%}" if scored.any() else "-",
+                       help="Share of days where the predicted breakout side was the actual breakout side")
+        long_col.metric("Predicted long breakouts", f"{(predictions[scored] == 1).mean():.1%}" if scored.any() else "-")
+
+    with st.expander("Loaded models"):
+        st.dataframe(pd.DataFrame(get_model_registry().metrics_table()), hide_index=True)
 
 with strategy_rules:
     st.subheader("Understanding the Opening Range Strategy")
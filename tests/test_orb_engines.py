@@ -0,0 +1,47 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+import orb_calculations as oc
+
+
+def synthetic_bars(days=15, seed=0):
+    # random walk of 5min bars on weekdays (UTC), enough for breakouts and previous session models
+    rng = np.random.default_rng(seed)
+    start = int(datetime(2021, 3, 1, tzinfo=timezone.utc).timestamp())
+    epoch = start + np.arange(days * 288) * 300
+    epoch = epoch[(epoch // 86400 + 3) % 7 < 5]  # 1970-01-01 is a thursday
+    close = (10000 + np.cumsum(rng.normal(0, 2, len(epoch)))).round(2)
+    open_ = np.r_[10000.0, close[:-1]]
+    high = (np.maximum(open_, close) + np.abs(rng.normal(0, 1, len(epoch)))).round(2)
+    low = (np.minimum(open_, close) - np.abs(rng.normal(0, 1, len(epoch)))).round(2)
+    return pl.DataFrame({"time": epoch, "open": open_, "high": high, "low": low, "close": close}).with_columns(
+        pl.from_epoch("time", time_unit="s").dt.convert_time_zone("America/New_York"))
+
+
+def orb_tables(bars, engine, orb_duration):
+    orb = oc.OpeningRange("nq", orb_duration=orb_duration, data=bars, engine=engine, bar_store=None)
+    return {session: orb.get_single_orb_table(session) for session in orb.sessions}
+
+
+@pytest.mark.parametrize("orb_duration", [60, 30])
+def test_single_pass_equals_legacy(orb_duration):
+    bars = synthetic_bars()
+    legacy = orb_tables(bars, "legacy", orb_duration)
+    single_pass = orb_tables(bars, "single_pass", orb_duration)
+    for session in legacy:
+        assert legacy[session].height > 5
+        assert legacy[session]["breakout_time"].is_not_null().any()
+        assert_frame_equal(single_pass[session], legacy[session])
+
+
+def test_single_pass_without_bars():
+    bars = synthetic_bars().clear()
+    legacy = orb_tables(bars, "legacy", 60)
+    single_pass = orb_tables(bars, "single_pass", 60)
+    for session in legacy:
+        assert single_pass[session].is_empty()
+        assert_frame_equal(single_pass[session], legacy[session])
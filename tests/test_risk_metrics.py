@@ -0,0 +1,16 @@
+import numpy as np
+
+from risk_metrics import r_ratio, risk_summary
+
+
+def test_r_ratio():
+    r = np.array([2.0, -1.0, 1.0, -1.0])
+    assert np.isclose(r_ratio(r), r.mean() / r.std(ddof=1))
+
+
+def test_r_ratio_without_spread():
+    # all targets hit at 1/0.3 R: the std is rounding noise, not a spread of the results
+    r = np.full(37, 1 / 0.3)
+    assert np.isnan(r_ratio(r))
+    assert np.isnan(r_ratio(np.tile(r, (3, 1)))).all()
+    assert np.isnan(risk_summary(np.zeros(0))["r_ratio"])
@@ -0,0 +1,30 @@
+import numpy as np
+
+# Statistics of times of day given as seconds since midnight (NaN = no time, e.g. no breakout)
+quantiles = {"p10": 0.1, "p25": 0.25, "p75": 0.75, "p90": 0.9}
+
+
+def time_statistics(seconds):
+    seconds = np.asarray(seconds, dtype=float)
+    seconds = np.sort(seconds[~np.isnan(seconds)])
+    count = len(seconds)
+    stats = {"count": count}
+    if not count:
+        stats.update({name: np.nan for name in ["median", "mode", "mean", *quantiles]})
+        return stats
+
+    # upper median like the former sorted(times)[len(times) // 2]
+    stats["median"] = seconds[count // 2]
+
+    # smallest of the most frequent times like pandas mode()[0]
+    values, counts = np.unique(seconds, return_counts=True)
+    stats["mode"] = values[np.argmax(counts)]
+    stats["mean"] = seconds.mean()
+
+    # linear interpolation between the sorted values (numpy's default quantile method)
+    positions = np.array(list(quantiles.values())) * (count - 1)
+    lower = np.floor(positions).astype(int)
+    upper = np.ceil(positions).astype(int)
+    values = seconds[lower] + (seconds[upper] - seconds[lower]) * (positions - lower)
+    stats.update(zip(quantiles, values))
+    return stats